@@ -51,9 +51,8 @@ usual buttons (because the Cell Correspondence makes also mistakes).
 
 """
 import sys
+import multiprocessing
 import numpy as np
-import pandas as pd
-import h5py
 import skimage
 
 # For writing excel files
@@ -69,9 +68,7 @@ from PyQt5 import QtGui
 from matplotlib.backends.qt_compat import QtWidgets
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 
-from sklearn.decomposition import PCA
-import imageio
-from PIL import Image, ImageDraw
+import tifffile
 
 #append all the paths where the modules are stored. Such that this script
 #looks into all of these folders when importing modules.
@@ -114,11 +111,18 @@ import InitLayout
 
 # PlotCanvas for fast plotting
 from PlotCanvas import PlotCanvas
+# QtCanvas for faster display without matplotlib
+from QtCanvas import QtCanvas
 
 import Extract as extr
-from image_loader import load_image
+from UndoHistory import UndoHistory
+from run_manifest import RunManifest
+import BackgroundJob as bgjob
+import ExtractionJob as extrjob
 from segment import segment
-import neural_network as nn
+from relabel import relabel, remove_cells, merge_with_neighbors, exchange_mapping
+from cell_features import changed_bbox
+from Polygon import fill_polygon
 
 
 if getattr(sys, 'frozen', False):
@@ -143,7 +147,7 @@ class App(QMainWindow):
     """This class creates the main window.
     """
 
-    def __init__(self, nd2pathstr, hdfpathstr, newhdfstr):
+    def __init__(self, nd2pathstr, hdfpathstr, newhdfstr, canvas='matplotlib'):
         super().__init__()
         self.setWindowTitle('YeaZ')
 
@@ -171,6 +175,25 @@ class App(QMainWindow):
         self.Tindex = 0
         self.FOVindex = 0
         
+        # cost used to match the cells when tracking, 'features' (center of
+        # mass and area) or 'overlap', as chosen when launching the CNN
+        self.tracking_cost = 'features'
+        
+        # history of the edits of the masks, for undo/redo, per (FOV, time)
+        self.history = UndoHistory()
+        
+        # copy of the current mask as it was last saved, with the key 
+        # (FOV, time) and the mask it belongs to, such that the edits can be
+        # saved without reading the stored mask (see SaveMask)
+        self.savedmask = None
+        
+        # the frames are never modified, such that they are shared (and not
+        # copied) when changing the time index, and the display buffers
+        # which the canvas caches per frame are reused. All the missing
+        # frames share the same blank frame.
+        self.blankframe = np.zeros([self.reader.sizey, self.reader.sizex], dtype = np.uint16)
+        self.blankframe.flags.writeable = False
+        
         # loading the first images of the cells from the nd2 file
         self.currentframe = self.reader.LoadOneImage(self.Tindex,self.FOVindex)
         
@@ -179,9 +202,9 @@ class App(QMainWindow):
         if self.Tindex+1 < self.reader.sizet:
             self.nextframe = self.reader.LoadOneImage(self.Tindex+1, self.FOVindex)
         else:
-            self.nextframe = np.zeros([self.reader.sizey, self.reader.sizex])
+            self.nextframe = self.blankframe
         
-        self.previousframe = np.zeros([self.reader.sizey, self.reader.sizex])
+        self.previousframe = self.blankframe
 
         # loading the first masks from the hdf5 file
         self.mask_curr = self.reader.LoadMask(self.Tindex, self.FOVindex)
@@ -222,6 +245,12 @@ class App(QMainWindow):
         self.button_exval = QPushButton('Exchange cell IDs')
         self.buttonlist.append(self.button_exval)
         
+        self.button_undo = QPushButton('Undo')
+        self.buttonlist.append(self.button_undo)
+        
+        self.button_redo = QPushButton('Redo')
+        self.buttonlist.append(self.button_redo)
+        
         self.button_showval = QCheckBox('Show cell IDs')
         self.buttonlist.append(self.button_showval)
         
@@ -290,7 +319,13 @@ class App(QMainWindow):
 
         # Here our canvas is created where using matplotlib, 
         # one can plot data to display the pictures and masks.
-        self.m = PlotCanvas(self)
+        # The Qt canvas shows them directly with Qt, and comes with its own
+        # navigation (zoom, pan and history of views).
+        if canvas == 'qt':
+            self.m = QtCanvas(self)
+            self.Nvgtlbar = self.m.navigation
+        else:
+            self.m = PlotCanvas(self)
         
         # Initialize all the buttons that are needed and the functions that are 
         # connected when the buttons are triggered.
@@ -310,9 +345,10 @@ class App(QMainWindow):
         # QPushbuttons are used and are connected to the functions of the toolbar
         # it is than easier to interact with these buttons (for example to 
         # to disable them and so on..)
-        self.Nvgtlbar = NavigationToolbar(self.m, self)
-        self.addToolBar(self.Nvgtlbar)
-        self.Nvgtlbar.hide()
+        if canvas != 'qt':
+            self.Nvgtlbar = NavigationToolbar(self.m, self)
+            self.addToolBar(self.Nvgtlbar)
+            self.Nvgtlbar.hide()
         
         # creates a status bar with user instructions
         self.statusBar = QStatusBar()
@@ -429,35 +465,28 @@ class App(QMainWindow):
         self.Disable(self.button_extractfluorescence)
         self.WriteStatusBar('Extracting ...')
         
-        # Get last image with mask
-        for time_index in range(self.reader.sizet-1, -1, -1):            
-            # Test if time has a mask
-            file = h5py.File(self.reader.hdfpath, 'r+')
-            time_exist = self.reader.TestTimeExist(time_index, self.FOVindex, file)
-            file.close()
-            
-            if not time_exist:
-                continue
-            
-            # load picture and sheet
-            image = self.reader.LoadImageChannel(time_index, self.FOVindex, 
-                                                 self.reader.default_channel)
-            mask = self.reader.LoadMask(time_index, self.FOVindex)
-            
-            # Break if mask is non-empty
-            if mask.sum()>0:
-                break
-            
-            if time_index==0:
-                QMessageBox(self, 'Error', 'No mask found')
-                self.Enable(self.button_extractfluorescence)
-                self.ClearStatusBar()
+        # Get last image with non-empty mask, found from the stored number 
+        # of cells of every frame
+        time_index = self.reader.LastNonEmptyTime(self.FOVindex)
+        if time_index is None:
+            QMessageBox.critical(self, 'Error', 'No mask found')
+            self.Enable(self.button_extractfluorescence)
+            self.ClearStatusBar()
+            return
+        
+        # load picture and sheet
+        image = self.reader.LoadImageChannel(time_index, self.FOVindex, 
+                                             self.reader.default_channel)
+        mask = self.reader.LoadMask(time_index, self.FOVindex)
         
         # Launch dialog with last image
-        dlg = extr.Extract(image, mask, self.reader.channel_names)
+        fov_names = ['Field of View {}'.format(i+1) for i in range(self.reader.Npos)]
+        dlg = extr.Extract(image, mask, self.reader.channel_names, fov_names,
+                           self.FOVindex, self.reader.sizet)
         dlg.exec()
         if dlg.exit_code == 1: # Fluorescence
-            self.ExtractFluo(dlg.cells, dlg.desel_cells, dlg.outfile, dlg.file_list)
+            self.ExtractFluo(dlg.cells, dlg.desel_cells, dlg.outfile, dlg.file_list,
+                             dlg.fovs, dlg.times)
         elif dlg.exit_code == 2: # Mask
             self.ExtractMask(dlg.desel_cells, dlg.outfile)
             
@@ -467,39 +496,31 @@ class App(QMainWindow):
 
     def ExtractMask(self, desel_cells, outfile):
         """Extract the mask to the specified tiff file. Only take cells 
-        specified by the cell_list"""
+        specified by the cell_list. 
         
-        mask_list = []
-        for time_index in range(0, self.reader.sizet):
-            
-            # Test if time has a mask
-            file = h5py.File(self.reader.hdfpath, 'r+')
-            time_exist = self.reader.TestTimeExist(time_index, self.FOVindex, file)
-            file.close()
-            
-            if not time_exist:
-                continue
-            
-            mask = self.reader.LoadMask(time_index, self.FOVindex)
-            for cell in desel_cells:
-                mask[mask==cell] = 0
-            mask_list.append(mask)
-            
-        imageio.mimwrite(outfile, np.array(mask_list, dtype=np.uint16))
+        The frames are written one page at a time into a BigTIFF file while 
+        they are read, such that only one frame is kept in memory whatever
+        the length of the movie."""
+        times = self.reader.MaskTimes(self.FOVindex)
+        if len(times) == 0:
+            return
+        
+        frames = (remove_cells(mask, desel_cells, out=mask) 
+                  for mask in self.reader.ReadMasks(self.FOVindex, times))
+        with tifffile.TiffWriter(outfile, bigtiff=True) as tif:
+            tif.write(frames, dtype=np.uint16, photometric='minisblack',
+                      shape=(len(times), self.reader.sizey, self.reader.sizex))
                         
 
-    def ExtractFluo(self, sel_cells, desel_cells, csv_filename, channel_list):
-        """This is the function that takes as argument the filepath to the xls
-        file and writes in the file.
-        It iterates over the different channels (or the sheets of the file,
-        each channel has one sheet.), and reads the image corresponding
-        to the time, field of view and channel index. It reads the already
-        existing file and makes a copy in which the data will be written in it.
-        
-        The first step of calculating the data is to iterate through each
-        cell/segment of the mask (so each cell is a submatrix of one value
-        in the matrix of the mask).
-        For each of these value /cell, the area is extracted as being
+    def ExtractFluo(self, sel_cells, desel_cells, outfile, channel_list,
+                    fovs=None, times=None):
+        """This is the function that takes as argument the filepath to the csv
+        (or Parquet/Feather) file and writes in the file the statistics of 
+        every cell, for the 
+        fields of view fovs (default: the current one), the time frames 
+        times (default: all) and the channels (or files) in channel_list.
+        
+        For each of these cells, the area is extracted as being
         the number of pixels corresponding to this cell/value. 
         (it is known from the microscope settings how to convert
         the pixel in area).
@@ -510,119 +531,25 @@ class App(QMainWindow):
         With the mean it is then possible to calculate the variance of the 
         signal for one cell/value.
         
-        Then, it is checked if the value of the cell (cell number) already
-        exists in the first column, if it already exists it continues to
-        find the column corresponding to the time index where the values
-        should be written. It sets the flag to True such that it does not
-        write the cell as new one and adds it at the end of the column
-        
-        If the value is not found in the cell number column (new cell or
-        first time writing in the file), the flag is False, thus it adds the 
-        cell number at the end of the column.
-        It then saves the xls file.
-        
+        The cells in desel_cells are disregarded in the current field of 
+        view, and the cells which are not in sel_cells are flagged as 
+        disappeared. The work is done by a pool of processes in a background
+        job (see ExtractionJob.py), while a progress dialog is shown.
         """
-        # List of cell properties
-        cell_list = []
-
-        for time_index in range(0, self.reader.sizet):
-            # Test if time has a mask
-            file = h5py.File(self.reader.hdfpath, 'r+')
-            time_exist = self.reader.TestTimeExist(time_index, self.FOVindex, file)
-            file.close()
-            
-            if not time_exist:
-                continue
-            
-            mask = self.reader.LoadMask(time_index, self.FOVindex)
-            
-            for channel in channel_list:
-                # check if channel is in list of nd2 channels
-                try:
-                    channel_ix = self.reader.channel_names.index(channel)
-                    image = self.reader.LoadImageChannel(time_index, self.FOVindex, channel_ix)
-                
-                # channel is a file
-                except ValueError:
-                    image = load_image(channel, ix=time_index)
-                    
-                for val in np.unique(mask):
-                    # bg is not cell
-                    if val == 0:
-                        continue
-                    # disregard cells not in cell_list
-                    if (val in desel_cells):
-                        continue
-                    
-                    # Calculate stats
-                    stats = {'Cell': val,
-                             'Time': time_index,
-                             'Channel': channel}
-                    
-                    stats = {**stats,
-                             **self.cell_statistics(image, mask == val)}
-                    stats['Disappeared in video'] = not (val in sel_cells)
-                    cell_list.append(stats)
-                    
-        
-        # Use Pandas to write csv
-        df = pd.DataFrame(cell_list)
-        df = df.sort_values(['Cell', 'Time'])
-        df.to_csv(csv_filename, index=False)
+        if fovs is None:
+            fovs = [self.FOVindex]
+        if times is None:
+            times = list(range(0, self.reader.sizet))
+        selections = {self.FOVindex: (sel_cells, desel_cells)}
+        
+        def extract(progress, is_cancelled):
+            return extrjob.extract(self.reader, fovs, times, channel_list, 
+                                   outfile, selections, progress, is_cancelled)
+        bgjob.run_job(self, extract, 'Extracting cell statistics...')
                     
         self.Enable(self.button_extractfluorescence)
         self.ClearStatusBar()
 
-
-    def cell_statistics(self, image, mask):
-        """Calculate statistics about cells. Passing None to image will
-        create dictionary to zeros, which allows to extract dictionary keys"""
-        if image is not None:
-            cell_vals = image[mask]
-            area = mask.sum()
-            tot_intensity = cell_vals.sum()
-            mean = tot_intensity/area if area > 0 else 0
-            var = np.var(cell_vals)
-            
-            # Center of mass
-            y,x = mask.nonzero()
-            com_x = np.mean(x)
-            com_y = np.mean(y)
-            
-            # PCA only works for multiple points
-            if area > 1:
-                pca = PCA().fit(np.array([y,x]).T)
-                pc1_x, pc1_y = pca.components_[0,:]
-                angle = np.arctan(pc1_y / pc1_x) / np.pi * 360
-                v1, v2 = pca.explained_variance_
-                
-                len_maj = 4*np.sqrt(v1)
-                len_min = 4*np.sqrt(v2)
-            else:
-                angle = 0
-                len_maj = 1
-                len_min = 1
-            
-        else:
-            mean = 0
-            var = np.nan
-            tot_intensity = 0
-            com_x = np.nan
-            com_y = np.nan
-            angle = np.nan
-            len_maj = np.nan
-            len_min = np.nan
-        
-        return {'Area': area,
-                'Mean': mean,
-                'Variance': var,
-                'Total Intensity': tot_intensity,
-                'Center of Mass X': com_x,
-                'Center of Mass Y': com_y,
-                'Angle of Major Axis': angle,
-                'Length Major Axis': len_maj,
-                'Length Minor Axis': len_min}
-
 # -----------------------------------------------------------------------------
 # NEURAL NETWORK
     def ShowHideCNNbuttons(self):
@@ -650,6 +577,10 @@ class App(QMainWindow):
         Once it reads all the value, it calls the neural network function
         inside of self.PredThreshSeg and it does the prediction of the neural
         network, thresholds this prediction and then segments it.
+        
+        Every segmented frame is recorded in a manifest next to the mask 
+        file, such that an interrupted run can be resumed by skipping the 
+        frames already segmented with the same parameters.
         """
         def reset():
             self.m.UpdatePlots()
@@ -688,6 +619,11 @@ class App(QMainWindow):
             
             # displays that the neural network is running
             self.WriteStatusBar('Running the neural network...')
+            
+            if dlg.check_overlap.isChecked():
+                self.tracking_cost = 'overlap'
+            else:
+                self.tracking_cost = 'features'
     
             #it iterates in the list of the user-selected fields 
             #of view, to return the corresponding index, the function
@@ -695,26 +631,36 @@ class App(QMainWindow):
             if len(dlg.listfov.selectedItems())==0:
                 QMessageBox.critical(self, "Error", "No FOV Selected")
             
+            if dlg.entry_threshold.text() !=  '':
+                thr_val = float(dlg.entry_threshold.text())
+            else:
+                thr_val = None
+            if dlg.entry_segmentation.text() != '':
+                seg_val = int(dlg.entry_segmentation.text())
+            else:
+                seg_val = 10
+            is_pc = dlg.radiobuttons.checkedId() == 1
+            manifest = RunManifest(self.reader.hdfpath + '.manifest.jsonl',
+                                   {'thr_val': thr_val, 'seg_val': seg_val, 
+                                    'is_pc': is_pc})
+            resume = dlg.check_resume.isChecked()
+            
             for item in dlg.listfov.selectedItems():
+                fov = dlg.listfov.row(item)
                 #iterates over the time indices in the range
-                for t in range(time_value1, time_value2+1):                    
+                for t in range(time_value1, time_value2+1):
+                    if resume and manifest.is_done(self.nd2path, fov, t):
+                        print('--------- Already segmented field of view:',fov,'Time point:',t)
+                        continue
                     #calls the neural network for time t and selected
                     #fov
-                    if dlg.entry_threshold.text() !=  '':
-                        thr_val = float(dlg.entry_threshold.text())
-                    else:
-                        thr_val = None
-                    if dlg.entry_segmentation.text() != '':
-                        seg_val = int(dlg.entry_segmentation.text())
-                    else:
-                        seg_val = 10
-                    is_pc = dlg.radiobuttons.checkedId() == 1
-                    self.PredThreshSeg(t, dlg.listfov.row(item), thr_val, seg_val,
-                                       is_pc)
+                    if self.PredThreshSeg(t, fov, thr_val, seg_val, is_pc):
+                        manifest.record(self.nd2path, fov, t)
                     
-                    # apply tracker if wanted and if not at first time
-                    temp_mask = self.reader.CellCorrespondence(t, dlg.listfov.row(item))
-                    self.reader.SaveMask(t,dlg.listfov.row(item), temp_mask)
+                # apply tracker to the whole time range in one pass
+                self.WriteStatusBar('Tracking the cells...')
+                self.reader.TrackFrames(time_value1, time_value2, 
+                                        fov, self.tracking_cost)
             
             self.ReloadThreeMasks()
         reset()
@@ -728,7 +674,7 @@ class App(QMainWindow):
         InteractionDisk.py file and then thresholds the result
         of the prediction, saves this thresholded prediction.
         Then it segments the thresholded prediction and saves the
-        segmentation. 
+        segmentation. Returns True if the frame has been segmented.
         """
         print('--------- Segmenting field of view:',fovindex,'Time point:',timeindex)
         im = self.reader.LoadOneImage(timeindex, fovindex)
@@ -740,18 +686,25 @@ class App(QMainWindow):
                                  'be found. Make sure to download them from '
                                  'the link in the readme and put them into '
                                  'the folder unet')
-            return
+            return False
 
         thresh = self.ThresholdPred(thr_val, pred)
         seg = segment(thresh, pred, seg_val)
         self.reader.SaveMask(timeindex, fovindex, seg)
+        # the previous edits do not apply to the new segmentation
+        self.history.clear((fovindex, timeindex))
+        self.savedmask = None
         print('--------- Finished segmenting.')
+        return True
           
           
     def LaunchPrediction(self, im, is_pc):
         """It launches the neural neutwork on the current image and creates 
         an hdf file with the prediction for the time T and corresponding FOV. 
         """
+        # imported here, such that TensorFlow is not loaded by the processes
+        # of the extraction (which import this module again)
+        import neural_network as nn
         im = skimage.exposure.equalize_adapthist(im)
         im = im*1.0;	
         pred = nn.prediction(im, is_pc)                        
@@ -760,6 +713,7 @@ class App(QMainWindow):
 
     def ThresholdPred(self, thvalue, pred):     
         """Thresholds prediction with value"""
+        import neural_network as nn
         if thvalue == None:
             thresholdedmask = nn.threshold(pred)
         else:
@@ -785,7 +739,7 @@ class App(QMainWindow):
         The index correspondds to the field of view selected in the list.
         """
         # mask is automatically saved.
-        self.reader.SaveMask(self.Tindex, self.FOVindex, self.m.plotmask)
+        self.SaveMask()
         self.FOVindex = index    
         
         # it updates the fov in the plot with the new index.
@@ -806,7 +760,7 @@ class App(QMainWindow):
         self.m.plotmask = self.reader.LoadMask(self.Tindex,self.FOVindex)
         
         # sets the image and the mask to 0 for the previous plot
-        self.m.prevpicture = np.zeros([self.reader.sizey, self.reader.sizex], dtype = np.uint16)
+        self.m.prevpicture = self.blankframe
         self.m.prevplotmask = np.zeros([self.reader.sizey, self.reader.sizex], dtype = np.uint16)
         
         # load the image and the mask for the next plot, check if it exists
@@ -818,7 +772,7 @@ class App(QMainWindow):
             # fov/channel was changed
             self.button_nextframe.setEnabled(True)
         else:
-            self.m.nextpicture = np.zeros([self.reader.sizey, self.reader.sizex], dtype = np.uint16)
+            self.m.nextpicture = self.blankframe
             self.m.nextplotmask =  np.zeros([self.reader.sizey, self.reader.sizex], dtype = np.uint16)
             
             # disables the next frame button if the mask or the picture
@@ -905,7 +859,7 @@ class App(QMainWindow):
         # it reads out the text in the button and converts it to an int.
         newtimeindex = int(self.button_timeindex.text())
         if newtimeindex >= 0 and newtimeindex <= self.reader.sizet-1:
-            self.reader.SaveMask(self.Tindex, self.FOVindex, self.m.plotmask)
+            self.SaveMask()
             
             self.Tindex = newtimeindex
             
@@ -917,8 +871,7 @@ class App(QMainWindow):
                 self.m.currpicture = self.reader.LoadOneImage(self.Tindex, self.FOVindex)
                 self.m.plotmask = self.reader.LoadMask(self.Tindex, self.FOVindex)
                 
-                self.m.prevpicture = np.zeros([self.reader.sizey, self.reader.sizex], 
-                                              dtype = np.uint16)
+                self.m.prevpicture = self.blankframe
                 self.m.prevplotmask = np.zeros([self.reader.sizey, self.reader.sizex], 
                                                dtype = np.uint16)
     
@@ -933,8 +886,7 @@ class App(QMainWindow):
                 self.m.currpicture = self.reader.LoadOneImage(self.Tindex, self.FOVindex)
                 self.m.plotmask = self.reader.LoadMask(self.Tindex, self.FOVindex)
                   
-                self.m.nextpicture =  np.zeros([self.reader.sizey, self.reader.sizex], 
-                                               dtype = np.uint16)
+                self.m.nextpicture =  self.blankframe
                 self.m.nextplotmask =  np.zeros([self.reader.sizey, self.reader.sizex], 
                                                 dtype = np.uint16)
                 
@@ -971,7 +923,8 @@ class App(QMainWindow):
         self.Disable(self.button_cellcorrespondence)
         self.WriteStatusBar('Doing the cell correspondence')
         if self.Tindex > 0:
-            self.m.plotmask = self.reader.CellCorrespondence(self.Tindex, self.FOVindex)
+            self.m.plotmask = self.reader.CellCorrespondence(self.Tindex, self.FOVindex,
+                                                             self.tracking_cost)
             self.m.updatedata()
         else:
             pass
@@ -1035,12 +988,12 @@ class App(QMainWindow):
         self.Disable(self.button_nextframe)
 
         if self.Tindex + 1 < self.reader.sizet - 1 :
-            self.reader.SaveMask(self.Tindex, self.FOVindex, self.m.plotmask)
+            self.SaveMask()
             
-            self.m.prevpicture = self.m.currpicture.copy()
+            self.m.prevpicture = self.m.currpicture
             self.m.prevplotmask = self.m.plotmask.copy()
             
-            self.m.currpicture = self.m.nextpicture.copy()
+            self.m.currpicture = self.m.nextpicture
             self.m.plotmask = self.m.nextplotmask.copy()
             
             self.m.nextpicture = self.reader.LoadOneImage(self.Tindex+2, self.FOVindex)
@@ -1051,14 +1004,13 @@ class App(QMainWindow):
                 self.button_previousframe.setEnabled(True)
                 
         else:
-            self.reader.SaveMask(self.Tindex, self.FOVindex, self.m.plotmask)
+            self.SaveMask()
         
-            self.m.prevpicture = self.m.currpicture.copy()
+            self.m.prevpicture = self.m.currpicture
             self.m.prevplotmask = self.m.plotmask.copy()
-            self.m.currpicture = self.m.nextpicture.copy()
+            self.m.currpicture = self.m.nextpicture
             self.m.plotmask = self.m.nextplotmask.copy()
-            self.m.nextpicture = np.zeros([self.reader.sizey, self.reader.sizex], 
-                                          dtype = np.uint16)
+            self.m.nextpicture = self.blankframe
             self.m.nextplotmask = np.zeros([self.reader.sizey,self.reader.sizex], 
                                            dtype = np.uint16)
             self.m.UpdatePlots()
@@ -1088,15 +1040,15 @@ class App(QMainWindow):
         self.WriteStatusBar('Loading the previous frame...')
         self.Disable(self.button_previousframe)
         
-        self.reader.SaveMask(self.Tindex, self.FOVindex, self.m.plotmask)
+        self.SaveMask()
 
-        self.m.nextpicture = self.m.currpicture.copy()
+        self.m.nextpicture = self.m.currpicture
         self.m.nextplotmask = self.m.plotmask.copy()
-        self.m.currpicture = self.m.prevpicture.copy()
+        self.m.currpicture = self.m.prevpicture
         self.m.plotmask = self.m.prevplotmask.copy()
             
         if self.Tindex == 1:
-            self.m.prevpicture = np.zeros([self.reader.sizey, self.reader.sizex], dtype = np.uint16)
+            self.m.prevpicture = self.blankframe
             self.m.prevplotmask = np.zeros([self.reader.sizey, self.reader.sizex], dtype = np.uint16)
             self.button_previousframe.setEnabled(False)
             
@@ -1179,26 +1131,35 @@ class App(QMainWindow):
             newx = int(event.xdata)
             newy = int(event.ydata)
             
-            # creates a dialog window
-            dlg = cocv.CustomDialog(self)
+            # the background cannot be changed (nor propagated to the later
+            # frames, which would overwrite their whole background)
+            if self.m.plotmask[newy,newx] == 0:
+                QMessageBox.critical(self, 'Error', 'No cell at the clicked position.')
+                dlg = None
+            else:
+                # creates a dialog window
+                dlg = cocv.CustomDialog(self)
             
             #if the user presses 'ok' in the dialog window it executes the code
             #else it does nothing
-            if dlg.exec_():
+            if dlg is not None and dlg.exec_():
                 #it tests that the user has entered some value, that it is not
                 #empty and that it is equal or bigger to 0.
                 if dlg.entry1.text() != '' and int(dlg.entry1.text()) >= 0:
                     #reads the new value to set and converts it from str to int
                     value = int(dlg.entry1.text())
                     
-                    # gives the coordinates where it is equal to the value
-                    # selected by the user. And it replaces it with the new
-                    # value.
-                    self.m.plotmask[self.m.plotmask == self.m.plotmask[newy,newx]] = value
+                    # replaces the value of the cell selected by the user 
+                    # with the new value.
+                    mapping = {self.m.plotmask[newy,newx]: value}
+                    relabel(self.m.plotmask, mapping, out=self.m.plotmask)
                     
                     # updates the plot to see the modification.
                     self.m.updatedata()
                     
+                    if dlg.check_propagate.isChecked():
+                        self.PropagateCellValues(mapping)
+                    
         self.Enable(self.button_changecellvalue)
         self.button_changecellvalue.setChecked(False)
         self.m.ShowCellNumbers()
@@ -1224,17 +1185,46 @@ class App(QMainWindow):
                 value1 = int(dlg.entry1.text())
                 value2 = int(dlg.entry2.text())
                 
-                # calls the function which does the swap
+                # calls the function which does the swap. The values are
+                # checked before anything is changed, such that the swap is
+                # either applied to the current (and later) frames or not
+                # at all.
                 try:
+                    mapping = exchange_mapping(value1, value2)
                     self.m.ExchangeCellValue(value1,value2)
                 except ValueError as e:
                     QMessageBox.critical(self, 'Error', str(e))
+                    return
+                if dlg.check_propagate.isChecked():
+                    self.PropagateCellValues(mapping)
                 self.m.ShowCellNumbers()
                 self.SaveMask()
         else:
             return
 
 
+    def PropagateCellValues(self, mapping):
+        """Applies the change of cell values given by the dictionary mapping 
+        to all the masks after the current time frame, such that the cells
+        keep their new identity in the rest of the movie. This runs in a 
+        background job with a progress dialog, and the next mask is reloaded
+        to show the result."""
+        if self.Tindex+1 > self.reader.sizet-1:
+            return
+        
+        self.WriteStatusBar('Changing the cell IDs in the later frames...')
+        def relabel_frames(progress, is_cancelled):
+            return self.reader.RelabelFrames(self.Tindex+1, self.reader.sizet-1,
+                                             self.FOVindex, mapping, 
+                                             progress, is_cancelled)
+        bgjob.run_job(self, relabel_frames, 
+                      'Changing the cell IDs in the later frames...')
+        
+        self.m.nextplotmask = self.reader.LoadMask(self.Tindex+1, self.FOVindex)
+        self.m.UpdatePlots()
+        self.ClearStatusBar()
+        
+
     def MouseDraw(self):
         """
         This function is called whenever the brush or the eraser button is
@@ -1272,7 +1262,7 @@ class App(QMainWindow):
                                           lambda e: self.m.OneClick(e, radius))
             self.id = self.m.mpl_connect('motion_notify_event', 
                                          lambda e: self.m.PaintBrush(e, radius))
-            self.id3 = self.m.mpl_connect('button_release_event', self.m.ReleaseClick)
+            self.id3 = self.m.mpl_connect('button_release_event', self.BrushRelease)
                 
                         
         else:
@@ -1282,6 +1272,7 @@ class App(QMainWindow):
             QApplication.restoreOverrideCursor()
             self.Enable(self.button_drawmouse)
             self.Enable(self.button_eraser)
+            self.m.stroke_bbox = None
             self.SaveMask()
             self.ClearStatusBar()
             
@@ -1329,18 +1320,17 @@ class App(QMainWindow):
         
     def DoSplitCell(self):
         self.m.mpl_disconnect(self.id)
+        bbox = None
         if len(self.m.storemouseclicks) > 2:
-            nx, ny = self.m.plotmask.shape
-            img = Image.new('L', (ny, nx), 0)
-            ImageDraw.Draw(img).polygon(self.m.storemouseclicks, outline=1, fill=1)
-            polygon = np.array(img).astype(bool)
-            selected_mask = self.m.plotmask==self.cell_to_split
+            # the part of the cell inside the polygon becomes a new cell
             replace_cell = self.m.plotmask.max() + 1
-            self.m.plotmask[selected_mask & polygon] = replace_cell
+            bbox = fill_polygon(self.m.plotmask, self.m.storemouseclicks, 
+                                replace_cell, only=self.cell_to_split)
         self.Enable(self.button_split)
         self.m.UpdatePlots()
         self.ClearStatusBar()
-        self.SaveMask()
+        if bbox is not None:
+            self.SaveMask(bbox)
         self.m.storemouseclicks = []
         self.button_split.setChecked(False)
         
@@ -1400,14 +1390,16 @@ class App(QMainWindow):
             
         else:
             self.m.mpl_disconnect(self.id)
+            bbox = None
             if  self.m.storemouseclicks and self.TestSelectedPoints():
-                self.m.DrawRegion(True)
+                bbox = self.m.DrawRegion(True)
             else:
                 self.m.updatedata()
             self.Enable(self.button_newcell)
             self.m.ShowCellNumbers()
             self.ClearStatusBar()
-            self.SaveMask()
+            if bbox is not None:
+                self.SaveMask(bbox)
             
             
     def TestSelectedPoints(self):
@@ -1466,8 +1458,9 @@ class App(QMainWindow):
             self.m.mpl_disconnect(self.id)
             
             # test if the list is not empty and if the dots are not all in the same line
+            bbox = None
             if self.m.storemouseclicks and self.TestSelectedPoints():
-                self.m.DrawRegion(False)
+                bbox = self.m.DrawRegion(False)
 
             else:
                 self.m.updatedata()
@@ -1475,7 +1468,8 @@ class App(QMainWindow):
             self.Enable(self.button_add_region)
             self.m.ShowCellNumbers()
             self.ClearStatusBar()
-            self.SaveMask()
+            if bbox is not None:
+                self.SaveMask(bbox)
             
             
     def MergeWithNeighbors(self):
@@ -1525,27 +1519,25 @@ class App(QMainWindow):
         # test if the button is a left click and if the coordinates
         # chosen by the user click is inside of the current matplotlib plot
         # which is given by self.m.ax
+        bbox = None
         if (event.button == 1 
             and (event.xdata != None and event.ydata != None) 
             and self.m.ax == event.inaxes):
             newx = int(event.xdata)
             newy = int(event.ydata)
-            # get the ID of the selected cell
-            selectedcell_ID = self.m.plotmask[newy,newx]
-            # binarize the existing mask and number ("label") each component
-            labeled_binarized_mask = skimage.measure.label(self.m.plotmask > 0)
-            # select the component pixels that corresponds to the selected point
-            flood_indices=(labeled_binarized_mask==labeled_binarized_mask[newy,newx])
-            # set the mask pixels that correspond to the component to the cell ID
-            self.m.plotmask[flood_indices] = selectedcell_ID
+            # set the cells connected to the selected cell to its ID, by a
+            # flood fill around the selected cell
+            bbox = merge_with_neighbors(self.m.plotmask, newy, newx)
                     
             # updates the plot to see the modification.
-            self.m.updatedata()
+            if bbox is not None:
+                self.m.updatedata(bbox=bbox)
                     
         self.Enable(self.button_mergewithneighbors)
         self.button_mergewithneighbors.setChecked(False)
         self.m.ShowCellNumbers()
-        self.SaveMask()
+        if bbox is not None:
+            self.SaveMask(bbox)
         self.ClearStatusBar()
         
         
@@ -1613,12 +1605,80 @@ class App(QMainWindow):
         self.button_split.setEnabled(False)
         
     
-    def SaveMask(self):
+    def SaveMask(self, bbox=None, record=True):
         """
         When this function is called, it saves the current mask
-        (self.m.plotmask)
+        (self.m.plotmask). The changes since the last save are added to
+        the history of the edits, to be undone (unless record is False).
+        
+        If the bounding box bbox (rmin, cmin, rmax, cmax) of all the changes
+        since the last save is given (as returned by the editing tools), the
+        changes are found by comparing it with the copy of the mask as it 
+        was last saved, such that the stored mask is not read. Otherwise, 
+        the whole mask is compared with the stored one.
         """
-        self.reader.SaveMask(self.Tindex, self.FOVindex, self.m.plotmask)
+        mask = self.m.plotmask
+        key = (self.FOVindex, self.Tindex)
+        saved = self.savedmask
+        if (bbox is not None and saved is not None 
+            and saved[0] == key and saved[1] is mask):
+            copy = saved[2]
+            r0, c0, r1, c1 = bbox
+            change = changed_bbox(copy[r0:r1, c0:c1], mask[r0:r1, c0:c1])
+            if change is None:
+                return
+            bbox = (r0 + change[0], c0 + change[1], r0 + change[2], c0 + change[3])
+            r0, c0, r1, c1 = bbox
+            change = self.reader.SaveMask(self.Tindex, self.FOVindex, mask, 
+                                          bbox, copy[r0:r1, c0:c1].copy())
+            copy[r0:r1, c0:c1] = mask[r0:r1, c0:c1]
+        else:
+            change = self.reader.SaveMask(self.Tindex, self.FOVindex, mask)
+            self.savedmask = (key, mask, mask.copy())
+            
+        if change is not None and record:
+            bbox, old = change
+            r0, c0, r1, c1 = bbox
+            self.history.record(key, bbox, old, mask[r0:r1, c0:c1])
+        
+        
+    def BrushRelease(self, event):
+        """Ends a stroke of the brush or eraser, which is saved such that
+        every stroke can be undone"""
+        self.m.ReleaseClick(event)
+        bbox, self.m.stroke_bbox = self.m.stroke_bbox, None
+        if bbox is not None:
+            self.SaveMask(bbox)
+        
+        
+    def Undo(self):
+        """Reverts the last edit of the current mask"""
+        self.UndoRedo(self.history.undo, 'Nothing to undo.')
+        
+        
+    def Redo(self):
+        """Applies again the last undone edit of the current mask"""
+        self.UndoRedo(self.history.redo, 'Nothing to redo.')
+        
+        
+    def UndoRedo(self, step, message):
+        """Applies step (undo or redo of the history) to the current mask, 
+        saves it without recording it as a new edit and redraws the changed 
+        part"""
+        # pending changes are saved as an edit first
+        self.SaveMask()
+        try:
+            bbox = step((self.FOVindex, self.Tindex), self.m.plotmask)
+        except ValueError as e:
+            QMessageBox.critical(self, 'Error', str(e))
+            return
+        if bbox is None:
+            self.WriteStatusBar(message)
+            return
+        self.SaveMask(bbox, record=False)
+        self.m.updatedata(bbox=bbox)
+        self.m.ShowCellNumbers()
+        self.ClearStatusBar()
         
         
     def WriteStatusBar(self, text):
@@ -1632,6 +1692,8 @@ class App(QMainWindow):
 
 
 if __name__ == '__main__':
+    # needed for the processes of the extraction job in frozen applications
+    multiprocessing.freeze_support()
     app = QApplication(sys.argv)
     
     # If two arguments are given, make them nd2name and hdfname
@@ -1648,7 +1710,8 @@ if __name__ == '__main__':
             nd2name1 = wind.nd2name
             hdfname1 = wind.hdfname
             hdfnewname = wind.newhdfentry.text()
-            ex = App(nd2name1, hdfname1, hdfnewname)
+            canvas = 'qt' if wind.fastdisplay.isChecked() else 'matplotlib'
+            ex = App(nd2name1, hdfname1, hdfnewname, canvas)
             sys.exit(app.exec_())
         else:
             app.exit()
@@ -3,5 +3,14 @@ from population_batch import PopulationBatch
 my_directory = 'data/Replication_Timing_200ms_GFP_400ms_RFP_04072021'
 my_glob_pattern = '*Trans.tif'
 my_fluor_list = ['GFP', 'RFP']
+# skip the files already processed by an interrupted run
+my_resume = True
 
-my_batch = PopulationBatch(my_directory, my_glob_pattern, my_fluor_list)
\ No newline at end of file
+if __name__ == '__main__':
+    # the files are processed in parallel, and the masks and measurements
+    # are written to my_directory/population_results as they finish
+    my_batch = PopulationBatch(my_directory, my_glob_pattern, my_fluor_list,
+                               resume=my_resume)
+    for i, result in enumerate(my_batch):
+        print('Processed image ' + str(i+1) + ' of ' + str(len(my_batch)) + ': ' +
+              result.file + ', ' + str(result.ncells) + ' cells')
@@ -5,7 +5,7 @@ Created on Tue Nov 19 17:38:58 2019
 
 from PyQt5.QtWidgets import (QPushButton, QDialog, QDialogButtonBox, 
                              QLineEdit, QFormLayout, QMessageBox, 
-                             QFileDialog, QLabel)
+                             QFileDialog, QLabel, QCheckBox)
 import os
 
 
@@ -37,6 +37,9 @@ class FileBrowser(QDialog):
         
         self.newhdfentry = QLineEdit()
         self.newhdfentry.setText("newmaskfile")
+        
+        self.fastdisplay = QCheckBox('Fast display (Qt)')
+        self.fastdisplay.setToolTip("Display the images directly with Qt instead of matplotlib")
 
         self.nd2name = ''
         self.hdfname = ''
@@ -62,6 +65,7 @@ class FileBrowser(QDialog):
         flo.addRow(self.labelfolder, self.button_openfolder)
         flo.addRow(self.labelhdf, self.button_openhdf)
         flo.addRow('If no hdf file already exists, give a name to create a new file', self.newhdfentry)
+        flo.addRow(self.fastdisplay)
         
         flo.addWidget(self.buttonBox)
        
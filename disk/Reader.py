@@ -15,6 +15,8 @@ import skimage
 import skimage.io
 #import pytiff
 import hungarian as hu
+import cell_features as cf
+from relabel import relabel
 
 
 class Reader:
@@ -205,6 +207,113 @@ class Reader:
             return zeroarray
             
             
+    def ReadMask(self, currentT, currentFOV):
+        """Returns the mask at the given time and field of view, or None if 
+        it does not exist. Unlike LoadMask, the file is opened read-only and
+        no mask is created, such that several processes can read at once."""
+        with h5py.File(self.hdfpath, 'r') as file:
+            key = '/{}/{}'.format(self.fovlabels[currentFOV], self.tlabels[currentT])
+            if key in file:
+                return np.array(file[key], dtype = np.uint16)
+        return None
+        
+        
+    def MaskTimes(self, currentFOV, file=None):
+        """Returns the sorted list of the time frames of the field of view 
+        which have a mask. If file is None, the hdf file is opened, 
+        otherwise the already open file is used."""
+        if file is None:
+            with h5py.File(self.hdfpath, 'r') as file:
+                return self.MaskTimes(currentFOV, file)
+        
+        if self.fovlabels[currentFOV] not in file:
+            return []
+        group = file[self.fovlabels[currentFOV]]
+        return [t for t in range(self.sizet) if self.tlabels[t] in group]
+        
+        
+    def ReadMasks(self, currentFOV, times):
+        """Yields the masks of the field of view at the given time frames 
+        one after the other (see ReadMask), such that only one frame is in 
+        memory at a time. The file is opened read-only once for all frames,
+        frames without mask are skipped."""
+        with h5py.File(self.hdfpath, 'r') as file:
+            if self.fovlabels[currentFOV] not in file:
+                return
+            group = file[self.fovlabels[currentFOV]]
+            for t in times:
+                if self.tlabels[t] in group:
+                    yield np.array(group[self.tlabels[t]], dtype = np.uint16)
+        
+        
+    def FeatureKey(self, currentT, currentFOV):
+        """Returns the path in the hdf file of the table of cell features 
+        (see cell_features.py) of the mask at the given time and field of 
+        view. The tables are kept in the group features, next to the masks."""
+        return '/features/{}/{}'.format(self.fovlabels[currentFOV], self.tlabels[currentT])
+        
+        
+    def WriteFeatures(self, file, currentT, currentFOV, table):
+        """Stores the table of cell features of the mask in the open file"""
+        key = self.FeatureKey(currentT, currentFOV)
+        if key in file:
+            del file[key]
+        file.create_dataset(key, data = table)
+        
+        
+    def GetFeatures(self, file, currentT, currentFOV, store=False):
+        """Returns the table of cell features of the mask at the given time
+        and field of view from the open file, or None if there is no mask.
+        If the table is not stored yet, it is computed from the mask, and 
+        stored if store is True."""
+        key = self.FeatureKey(currentT, currentFOV)
+        if key in file:
+            return file[key][()]
+        
+        maskkey = '/{}/{}'.format(self.fovlabels[currentFOV], self.tlabels[currentT])
+        if maskkey not in file:
+            return None
+        table = cf.compute_features(file[maskkey][()])
+        if store:
+            self.WriteFeatures(file, currentT, currentFOV, table)
+        return table
+        
+        
+    def ReadFeatures(self, currentT, currentFOV):
+        """Returns the table of cell features (area, bounding box, centroid
+        and moments of every cell, see cell_features.py) of the mask at the
+        given time and field of view, or None if there is no mask. Like 
+        ReadMask, the file is opened read-only, so a missing table is 
+        computed but not stored."""
+        with h5py.File(self.hdfpath, 'r') as file:
+            return self.GetFeatures(file, currentT, currentFOV)
+        
+        
+    def LastNonEmptyTime(self, currentFOV):
+        """Returns the last time frame of the field of view whose mask 
+        contains at least one cell, or None if there is none. The number of
+        cells of a frame is the length of its table of cell features, which 
+        is known without reading the table or the mask (tables missing from
+        older files are computed and stored once)."""
+        with h5py.File(self.hdfpath, 'r+') as file:
+            for t in self.MaskTimes(currentFOV, file)[::-1]:
+                key = self.FeatureKey(t, currentFOV)
+                if key in file:
+                    ncells = file[key].shape[0]
+                else:
+                    ncells = len(self.GetFeatures(file, t, currentFOV, store=True))
+                if ncells > 0:
+                    return t
+        return None
+        
+        
+    def LoadFeatures(self, currentT, currentFOV):
+        """Same as ReadFeatures, but a missing table is stored in the file,
+        such that it is computed only once."""
+        with h5py.File(self.hdfpath, 'r+') as file:
+            return self.GetFeatures(file, currentT, currentFOV, store=True)
+        
+        
     def TestTimeExist(self, currentT, currentFOV, file=None):
         """This method tests if the array which is requested by LoadMask
         already exists or not in the hdf file.
@@ -236,7 +345,7 @@ class Reader:
             return False
 
             
-    def SaveMask(self, currentT, currentFOV, mask):
+    def SaveMask(self, currentT, currentFOV, mask, bbox=None, old=None):
         """This function is called when the user wants to save the mask in the
         hdf5 file on the disk. It overwrites the existing array with the new 
         one given in argument. 
@@ -244,17 +353,47 @@ class Reader:
         be an existing null array which has been created by the LoadMask method
         when the new array has been loaded/created in the main before calling
         this save method.
+        
+        Only the bounding box of the pixels which differ from the stored 
+        mask is written, and the stored table of cell features is updated for
+        the cells touched by the changes (see cell_features.update_features).
+        Returns this bounding box (rmin, cmin, rmax, cmax) and the stored 
+        values which have been overwritten within it, or None if the stored 
+        mask has not changed (or did not exist).
+        
+        If the caller knows the bounding box of the changes bbox and the 
+        stored values old within it (e.g. from a copy of the mask as it was
+        last saved), the stored mask is not read.
         """
         
         file = h5py.File(self.hdfpath, 'r+')
         
         if self.TestTimeExist(currentT,currentFOV,file):
             dataset= file['/{}/{}'.format(self.fovlabels[currentFOV], self.tlabels[currentT])]
-            dataset[:] = mask
+            if bbox is None or old is None:
+                stored = dataset[()]
+                bbox = cf.changed_bbox(stored, mask)
+                if bbox is not None:
+                    r0, c0, r1, c1 = bbox
+                    old = stored[r0:r1, c0:c1]
+            change = None
+            if bbox is not None:
+                r0, c0, r1, c1 = bbox
+                dataset[r0:r1, c0:c1] = mask[r0:r1, c0:c1]
+                
+                key = self.FeatureKey(currentT, currentFOV)
+                if key in file:
+                    table = cf.update_features(file[key][()], old, mask, bbox)
+                else:
+                    table = cf.compute_features(mask)
+                self.WriteFeatures(file, currentT, currentFOV, table)
+                change = bbox, old
             file.close()
+            return change
             
         else:
             file.create_dataset('/{}/{}'.format(self.fovlabels[currentFOV], self.tlabels[currentT]), data = mask, compression = 'gzip')
+            self.WriteFeatures(file, currentT, currentFOV, cf.compute_features(mask))
             file.close()
         
         
@@ -339,10 +478,80 @@ class Reader:
             return self.LoadOneImage(currentT, currentFOV)
 
 
-    def CellCorrespondence(self, currentT, currentFOV):
+    def TrackFrames(self, startT, endT, currentFOV, cost='features'):
+        """Performs tracking on all the masks of the field of view from time 
+        startT to endT (included) in one streaming pass. The mask at startT is
+        tracked with respect to the mask at startT-1 if it exists. Every mask
+        is read and written exactly once and its features are only computed 
+        once (see hungarian.track_features): they are taken from the stored 
+        tables of cell features, which are relabelled along with the masks.
+        Time frames without mask are skipped, as well as a field of view 
+        without any mask. A mask which is left unaltered (the first one, if 
+        it has no precedent) is not written again. cost is the matching 
+        cost, 'features' or 'overlap'."""
+        with h5py.File(self.hdfpath, 'r+') as filemasks:
+            if self.fovlabels[currentFOV] not in filemasks:
+                return
+            group = filemasks[self.fovlabels[currentFOV]]
+            tables = {}
+            
+            def read(t):
+                if t >= 0 and self.tlabels[t] in group:
+                    tables[t] = self.GetFeatures(filemasks, t, currentFOV)
+                    return (group[self.tlabels[t]][()],) + cf.tracking_features(tables[t])
+                return None
+            
+            times = range(startT, endT+1)
+            frames = (read(t) for t in times)
+            for t, (newmask, mapping) in zip(times, hu.track_features(frames, read(startT-1), cost)):
+                if newmask is None:
+                    continue
+                table = tables.pop(t)
+                if mapping:
+                    group[self.tlabels[t]][...] = newmask
+                    self.WriteFeatures(filemasks, t, currentFOV, 
+                                       cf.relabel_features(table, mapping))
+
+
+    def RelabelFrames(self, startT, endT, currentFOV, mapping, 
+                      progress=None, is_cancelled=None):
+        """Changes the cell values of all the masks of the field of view from
+        time startT to endT (included) according to the dictionary mapping
+        (see relabel.relabel). The file is opened once and every mask is read
+        and written once, frames without mask are skipped. 
+        
+        progress(done, total) is called after every frame if given, and the
+        loop stops early if is_cancelled() returns True. Returns the number
+        of frames which have been relabelled. The background (value 0) 
+        cannot be relabelled, as it would overwrite the whole background of
+        the masks."""
+        if 0 in mapping:
+            raise ValueError('The background cannot be relabelled.')
+        done = 0
+        total = max(endT - startT + 1, 0)
+        with h5py.File(self.hdfpath, 'r+') as filemasks:
+            group = filemasks[self.fovlabels[currentFOV]]
+            for t in range(startT, endT+1):
+                if is_cancelled is not None and is_cancelled():
+                    break
+                if self.tlabels[t] in group:
+                    dataset = group[self.tlabels[t]]
+                    dataset[...] = relabel(dataset[()], mapping)
+                    key = self.FeatureKey(t, currentFOV)
+                    if key in filemasks:
+                        table = cf.relabel_features(filemasks[key][()], mapping)
+                        self.WriteFeatures(filemasks, t, currentFOV, table)
+                done += 1
+                if progress is not None:
+                    progress(done, total)
+        return done
+
+
+    def CellCorrespondence(self, currentT, currentFOV, cost='features'):
         """Performs tracking, handles loading of the images. If the image to 
         track has no precedent, returns unaltered mask. If no mask exists
-        for the current timeframe, returns zero array."""
+        for the current timeframe, returns zero array. cost is the matching
+        cost, 'features' or 'overlap'."""
         filemasks = h5py.File(self.hdfpath, 'r+')
         
         if self.TestTimeExist(currentT-1, currentFOV, filemasks):
@@ -352,7 +561,7 @@ class Reader:
             if self.TestTimeExist(currentT, currentFOV, filemasks):
                 nextmask = np.array(filemasks['/{}/{}'.format(self.fovlabels[currentFOV],
                                                               self.tlabels[currentT])])             
-                newmask = hu.correspondence(prevmask, nextmask)
+                newmask = hu.correspondence(prevmask, nextmask, cost)
                 out = newmask
             # No mask exists for the current timeframe, return empty array
             else:
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Manifest of a batch run (neural network over a range of frames, population
+batch), to resume it after an interruption. Every completed unit of work is
+recorded as one line of JSON, keyed by the input file, the field of view and
+time index, and a hash of the parameters of the run. The line is appended
+with a single write and flushed to the disk, such that an interrupted run
+leaves at most an incomplete last line, which is ignored.
+"""
+import hashlib
+import json
+import os
+import threading
+
+
+def parameter_hash(params):
+    """Returns a short hash of the dictionary of parameters params"""
+    text = json.dumps(params, sort_keys=True, default=str)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+class RunManifest:
+
+
+    def __init__(self, path, params):
+        """Opens the manifest at path (created at the first record) for a run
+        with the dictionary of parameters params. The units completed by
+        earlier runs with the same parameters are read from it."""
+        self.path = path
+        self.params = parameter_hash(params)
+        self.lock = threading.Lock()
+        self.records = {}
+        # an incomplete last line is terminated before the next record
+        self.newline = False
+        if os.path.isfile(path):
+            with open(path, 'r', encoding='utf-8') as file:
+                for line in file:
+                    self.newline = not line.endswith('\n')
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # incomplete line of an interrupted write
+                        continue
+                    if record.get('params') == self.params:
+                        key = (record['input'], record['fov'], record['t'])
+                        self.records[key] = record
+
+
+    def is_done(self, input, fov=None, t=None):
+        """Tests if the unit (input, fov, t) has been completed with the
+        parameters of this run"""
+        return (input, fov, t) in self.records
+
+
+    def get(self, input, fov=None, t=None):
+        """Returns the record of a completed unit (with the information given
+        to record), or None"""
+        return self.records.get((input, fov, t))
+
+
+    def record(self, input, fov=None, t=None, **info):
+        """Records the unit (input, fov, t) as completed, with additional
+        information info (which can be serialized to JSON)"""
+        record = {'input': input, 'fov': fov, 't': t,
+                  'params': self.params, **info}
+        line = (json.dumps(record) + '\n').encode('utf-8')
+        with self.lock:
+            if self.newline:
+                line = b'\n' + line
+                self.newline = False
+            fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                os.write(fd, line)
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+            self.records[(input, fov, t)] = record
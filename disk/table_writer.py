@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming writer for the extracted cell statistics in columnar formats
+(Parquet or Feather). The statistics of every frame are appended as one row
+group, such that the whole table never has to be kept in memory.
+
+Requires the optional package pyarrow.
+"""
+import os
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+
+COLUMNAR_EXTENSIONS = ['.parquet', '.feather', '.arrow']
+
+
+def is_columnar(path):
+    """Tests if path is a file which is written in a columnar format"""
+    _, ext = os.path.splitext(path)
+    return ext.lower() in COLUMNAR_EXTENSIONS
+
+
+def columnar_available():
+    """Tests if the package needed for the columnar formats is installed"""
+    return pa is not None
+
+
+def _schema():
+    """Types of the columns of the table of cell statistics"""
+    return pa.schema([('FOV', pa.int32()),
+                      ('Cell', pa.int64()),
+                      ('Time', pa.int32()),
+                      ('Channel', pa.dictionary(pa.int32(), pa.string())),
+                      ('Area', pa.int64()),
+                      ('Mean', pa.float64()),
+                      ('Variance', pa.float64()),
+                      ('Total Intensity', pa.float64()),
+                      ('Center of Mass X', pa.float64()),
+                      ('Center of Mass Y', pa.float64()),
+                      ('Angle of Major Axis', pa.float64()),
+                      ('Length Major Axis', pa.float64()),
+                      ('Length Minor Axis', pa.float64()),
+                      ('Disappeared in video', pa.bool_())])
+
+
+class TableWriter:
+
+
+    def __init__(self, path, channels):
+        """Opens the Parquet (.parquet) or Feather (.feather, .arrow) file
+        path for writing. channels is the list of all channel names, which
+        are dictionary-encoded."""
+        if pa is None:
+            raise ImportError('Writing Parquet or Feather files requires '
+                              'the package pyarrow')
+
+        self.path = path
+        self.schema = _schema()
+        self.channels = pa.array([str(c) for c in channels], pa.string())
+        self.channel_ix = {c: i for i, c in enumerate(channels)}
+
+        if path.lower().endswith('.parquet'):
+            self.writer = pq.ParquetWriter(path, self.schema)
+        else:
+            self.writer = pa.ipc.new_file(path, self.schema)
+
+
+    def write(self, df, fov=0):
+        """Appends the DataFrame df of cell statistics of one frame (as
+        returned by ExtractionJob.extract_frame) as one row group"""
+        if len(df) == 0:
+            return
+
+        columns = {}
+        for field in self.schema:
+            if field.name == 'FOV':
+                columns['FOV'] = pa.array(np.full(len(df), fov), field.type)
+            elif field.name == 'Channel':
+                indices = [self.channel_ix[c] for c in df['Channel']]
+                columns['Channel'] = pa.DictionaryArray.from_arrays(
+                    pa.array(indices, pa.int32()), self.channels)
+            else:
+                columns[field.name] = pa.array(df[field.name].to_numpy(),
+                                               field.type)
+
+        table = pa.Table.from_pydict(columns, schema=self.schema)
+        self.writer.write_table(table)
+
+
+    def close(self):
+        self.writer.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_table(path, columns=None, cells=None, fovs=None):
+    """Reads back a table written by TableWriter as a DataFrame. Only the
+    given columns and the rows of the given cells and fields of view are
+    loaded; for Parquet files, the row groups which do not contain them are
+    skipped using the statistics stored in the file."""
+    if pa is None:
+        raise ImportError('Reading Parquet or Feather files requires '
+                          'the package pyarrow')
+
+    filters = []
+    if cells is not None:
+        filters.append(('Cell', 'in', list(cells)))
+    if fovs is not None:
+        filters.append(('FOV', 'in', list(fovs)))
+
+    if path.lower().endswith('.parquet'):
+        table = pq.read_table(path, columns=columns, filters=filters or None)
+    else:
+        import pyarrow.feather as feather
+        import pyarrow.compute as pc
+
+        table = feather.read_table(path, memory_map=True)
+        for name, _, values in filters:
+            table = table.filter(pc.is_in(table[name], pa.array(values,
+                                 table.schema.field(name).type)))
+        if columns is not None:
+            table = table.select(columns)
+    return table.to_pandas()
@@ -141,6 +141,19 @@ def Init(parent):
     parent.button_eraser.setMaximumWidth(150)
     parent.button_eraser.setStatusTip('Drag to set values to background (=0).')
     
+    # UNDO / REDO
+    parent.button_undo.clicked.connect(parent.Undo)
+    parent.button_undo.setShortcut("Ctrl+Z")
+    parent.button_undo.setToolTip("Shortcut: Ctrl+Z")
+    parent.button_undo.setMaximumWidth(150)
+    parent.button_undo.setStatusTip('Undo the last edit of the mask.')
+    
+    parent.button_redo.clicked.connect(parent.Redo)
+    parent.button_redo.setShortcut("Ctrl+Y")
+    parent.button_redo.setToolTip("Shortcut: Ctrl+Y")
+    parent.button_redo.setMaximumWidth(150)
+    parent.button_redo.setStatusTip('Redo the last undone edit of the mask.')
+    
     # BRUSHSIZE
     parent.spinbox_brushsize.setMinimum(1)
     parent.spinbox_brushsize.setMaximumWidth(100)
@@ -49,6 +49,8 @@ def Init(parent):
     hboxcorrectionsbuttons.addWidget(parent.button_eraser)
     hboxcorrectionsbuttons.addWidget(parent.label_brushsize)
     hboxcorrectionsbuttons.addWidget(parent.spinbox_brushsize)
+    hboxcorrectionsbuttons.addWidget(parent.button_undo)
+    hboxcorrectionsbuttons.addWidget(parent.button_redo)
     hboxcorrectionsbuttons.addStretch(2)
     hboxcorrectionsbuttons.addWidget(parent.button_showval)
     hboxcorrectionsbuttons.addWidget(parent.button_hidemask)
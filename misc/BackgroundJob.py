@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Runs long operations (on many frames or fields of view) in a background
+thread, while a progress dialog is shown and the GUI stays responsive.
+"""
+from PyQt5.QtWidgets import QProgressDialog
+from PyQt5.QtCore import Qt, QThread, QEventLoop, pyqtSignal
+
+
+class Job(QThread):
+    """Thread calling func(progress, is_cancelled). The function reports its
+    progress by calling progress(done, total) and should regularly check
+    is_cancelled() to return early when the user aborts."""
+
+    progress = pyqtSignal(int, int)
+
+    def __init__(self, func, parent=None):
+        super(Job, self).__init__(parent)
+        self.func = func
+        self.result = None
+        self.error = None
+
+    def run(self):
+        try:
+            self.result = self.func(self.progress.emit,
+                                    self.isInterruptionRequested)
+        except Exception as e:
+            self.error = e
+
+
+def run_job(parent, func, label):
+    """Runs func (see Job) in a background thread and shows a progress dialog
+    with label and a cancel button. Events are processed while waiting,
+    such that the GUI stays responsive. Returns the return value of func,
+    exceptions raised in func are raised again here."""
+    dlg = QProgressDialog(label, 'Cancel', 0, 0, parent)
+    dlg.setWindowModality(Qt.WindowModal)
+    dlg.setAutoReset(False)
+    dlg.setMinimumDuration(0)
+
+    def update(done, total):
+        dlg.setMaximum(total)
+        dlg.setValue(done)
+
+    job = Job(func)
+    job.progress.connect(update)
+    dlg.canceled.connect(job.requestInterruption)
+
+    loop = QEventLoop()
+    job.finished.connect(loop.quit)
+    job.start()
+    dlg.show()
+    loop.exec_()
+    dlg.close()
+
+    if job.error is not None:
+        raise job.error
+    return job.result
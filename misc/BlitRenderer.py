@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rendering layer for the PlotCanvas: the static content of every axis
+(frame image, background) is rendered once and cached, and only the artists
+which change while editing (masks, cell numbers) are redrawn on top of it 
+and blitted to the screen, for the axes which have been marked as dirty.
+When the static content changes (new frame, zoom), the cached backgrounds
+are invalidated and the next render draws the whole figure.
+"""
+
+
+class BlitRenderer:
+
+
+    def __init__(self, canvas):
+        """Renders the panels of the matplotlib canvas. The background of
+        every panel is cached after each full draw of the figure (e.g. after
+        zooming or resizing)."""
+        self.canvas = canvas
+        self.panels = {}
+        self.backgrounds = {}
+        self.dirty = set()
+        self.cid = canvas.mpl_connect('draw_event', self.on_draw)
+
+
+    def add_panel(self, ax, artists):
+        """Registers the axis ax, whose changing artists are returned by the
+        function artists. These artists are made animated, such that they
+        are not part of the cached background."""
+        self.panels[ax] = artists
+        for artist in artists():
+            artist.set_animated(True)
+
+
+    def invalidate(self):
+        """Discards the cached backgrounds, such that the next call of 
+        render draws the whole figure and caches them again"""
+        self.backgrounds.clear()
+        self.dirty.update(self.panels)
+
+
+    def mark_dirty(self, *axes):
+        """Marks the panels of axes (default: all) to be redrawn by the next
+        call of render"""
+        self.dirty.update(axes if axes else self.panels)
+
+
+    def on_draw(self, event):
+        """Caches the backgrounds after a full draw of the figure, and draws
+        the animated artists on top of them"""
+        for ax in self.panels:
+            self.backgrounds[ax] = self.canvas.copy_from_bbox(ax.bbox)
+            self._draw_panel(ax)
+        self.dirty.clear()
+
+
+    def _draw_panel(self, ax):
+        for artist in self.panels[ax]():
+            if artist.get_visible():
+                ax.draw_artist(artist)
+
+
+    def render(self):
+        """Redraws the dirty panels: restores their cached background, draws
+        their artists and blits them to the screen"""
+        if not self.dirty:
+            return
+        if len(self.backgrounds) < len(self.panels):
+            # nothing drawn yet or static content changed, draw the whole
+            # figure once
+            self.canvas.draw()
+            return
+
+        for ax in self.dirty:
+            self.canvas.restore_region(self.backgrounds[ax])
+            self._draw_panel(ax)
+            self.canvas.blit(ax.bbox)
+        self.dirty.clear()
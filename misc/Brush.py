@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Brush of the editing tools: strokes are painted into the mask with a disk
+shaped stencil, only inside the bounding box of the stroke, such that the
+cost of a stroke does not depend on the size of the image.
+"""
+from functools import lru_cache
+
+import numpy as np
+from scipy import ndimage
+from skimage import morphology as morph
+from skimage import draw
+
+
+@lru_cache(maxsize=None)
+def stencil(radius):
+    """Returns the (read-only) disk of the brush of the given radius, as
+    used by the tools (morph.disk(radius-1))"""
+    disk = morph.disk(radius-1).astype(bool)
+    disk.setflags(write=False)
+    return disk
+
+
+def stroke(mask, x0, y0, x1, y1, value, radius=3):
+    """Paints the line from (x0, y0) to (x1, y1), widened by the disk of the
+    brush, with value into mask. A click is a line with a single point.
+    Returns the bounding box (rmin, cmin, rmax, cmax) of the painted pixels,
+    or None if the stroke lies outside of mask."""
+    disk = stencil(radius)
+    half = disk.shape[0] // 2
+    nrow, ncol = mask.shape
+
+    rr, cc, _ = draw.line_aa(y0, x0, y1, x1)
+    inside = (rr >= 0) & (rr < nrow) & (cc >= 0) & (cc < ncol)
+    rr, cc = rr[inside], cc[inside]
+    if len(rr) == 0:
+        return None
+
+    r0, r1 = max(rr.min() - half, 0), min(rr.max() + half + 1, nrow)
+    c0, c1 = max(cc.min() - half, 0), min(cc.max() + half + 1, ncol)
+    to_change = np.zeros((r1 - r0, c1 - c0), dtype=bool)
+    to_change[rr - r0, cc - c0] = True
+    to_change = ndimage.binary_dilation(to_change, structure=disk)
+
+    mask[r0:r1, c0:c1][to_change] = value
+    return r0, c0, r1, c1
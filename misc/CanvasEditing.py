@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This file contains the editing tools of the canvas (brush, eraser, drawing of
+regions, ...), which act on the masks and are shared by the matplotlib 
+canvas (PlotCanvas.py) and the Qt canvas (QtCanvas.py). 
+
+A canvas using them provides the axes ax, ax2 and ax3 (compared to the 
+inaxes attribute of the mouse events), the methods updatedata and 
+ShowCellNumbers to display the changes, and mpl_connect/mpl_disconnect for
+the mouse events.
+"""
+import numpy as np
+
+from PyQt5.QtCore import QTimer
+
+from matplotlib import cm
+from matplotlib.colors import ListedColormap
+
+from relabel import relabel, exchange_mapping
+import cell_features as cf
+import Brush
+from Polygon import fill_polygon
+
+
+# maximal number of redraws per second while painting
+REDRAW_FPS = 30
+
+
+def union_bbox(bbox1, bbox2):
+    """Returns the bounding box (rmin, cmin, rmax, cmax) of the boxes bbox1
+    and bbox2, either of which can be None"""
+    if bbox1 is None:
+        return None if bbox2 is None else tuple(bbox2)
+    if bbox2 is None:
+        return tuple(bbox1)
+    return (min(bbox1[0], bbox2[0]), min(bbox1[1], bbox2[1]), 
+            max(bbox1[2], bbox2[2]), max(bbox1[3], bbox2[3]))
+
+
+class CanvasEditing:
+    
+    
+    def InitEditing(self, parent):
+        """Initializes the state of the editing tools"""
+        # these variables are just set to test the states of the buttons
+        # (button turned on or  off, etc..) of the buttons in the methods 
+        # used in this class.
+        self.button_showval_check = parent.button_showval
+        self.button_newcell_check = parent.button_newcell
+        self.button_add_region_check = parent.button_add_region
+        self.button_drawmouse_check = parent.button_drawmouse
+        self.button_eraser_check = parent.button_eraser
+        self.button_hidemask_check = parent.button_hidemask
+        
+        # This attribute is a list which stores all the clicks of the mouse.
+        self.storemouseclicks = []
+        
+        # This attribute is used to store the square where the mouse has been
+        # in order than to draw lines (Paintbrush function)
+        self.storebrushclicks = [False,False]
+        
+        # self.cellval is the variable which sets the value to the pixel
+        # whenever something is drawn.
+        self.cellval = 0
+        
+        # the centers of the cells are cached by mask, until this mask is
+        # edited (see MaskChanged)
+        self.centers = {}
+        
+        # while painting, the edits are applied to the mask at once but the 
+        # screen is refreshed at most REDRAW_FPS times per second, for the
+        # union of the boxes edited in between
+        self.dirty_bbox = None
+        self.redraw_timer = QTimer()
+        self.redraw_timer.setSingleShot(True)
+        self.redraw_timer.setInterval(int(1000 / REDRAW_FPS))
+        self.redraw_timer.timeout.connect(self.FlushRedraw)
+        
+        # bounding box of the brush strokes on the current mask since they
+        # were last saved
+        self.stroke_bbox = None
+
+        
+    def ExchangeCellValue(self, val1, val2):
+        """Swaps the values of the cell between two clusters each representing
+        one cell. This method is called after the user has entered 
+        values in the ExchangeCellValues window.
+        """
+        mapping = exchange_mapping(val1, val2)
+        if (val1 in self.plotmask) and (val2 in self.plotmask):
+            relabel(self.plotmask, mapping, out=self.plotmask)
+            self.updatedata()
+        else:
+            raise ValueError('Cell value does not exist.') 
+        
+        
+    def ScheduleRedraw(self, bbox):
+        """Adds the box bbox (rmin, cmin, rmax, cmax) of the current mask to 
+        the part to redraw. It is redrawn at once if no redraw happened 
+        during the last 1/REDRAW_FPS seconds, else at the end of this time.
+        """
+        self.dirty_bbox = union_bbox(self.dirty_bbox, bbox)
+        if not self.redraw_timer.isActive():
+            self.FlushRedraw()
+            
+    
+    def FlushRedraw(self):
+        """Redraws the pending edits now, and waits 1/REDRAW_FPS seconds 
+        before the next redraw"""
+        if self.dirty_bbox is not None:
+            bbox, self.dirty_bbox = self.dirty_bbox, None
+            self.updatedata(bbox=bbox)
+            self.redraw_timer.start()
+            
+        
+    def ReleaseClick(self, event):
+        """This method is called from the brush button when the mouse is 
+        released such that the last coordinate saved when something is drawn
+        is set to zero. Because otherwise, if the user starts drawing somewhere
+        else, than a straight line is draw between the last point of the
+        previous mouse drawing/dragging and the new one which then starts.
+        """
+        self.FlushRedraw()
+        if self.ax == event.inaxes:
+            self.storebrushclicks = [False, False]
+            self.ShowCellNumbers()
+
+        
+    def OneClick(self, event, radius=3):
+        """This method is called when the Brush button is activated. And
+        sets the value of self.cellval if the click is a right click, or draws
+        a square if the click is a left click. (so if the user does just left
+        click but does not drag, there will be only a square which is drawn )
+        """
+        # Right click selects cell
+        if (event.button == 3 
+            and (event.xdata != None and event.ydata != None) 
+            and (not self.button_eraser_check.isChecked()) 
+            and self.ax == event.inaxes):
+            tempx = int(event.xdata)
+            tempy = int(event.ydata)
+            self.cellval = self.plotmask[tempy, tempx]
+            self.storebrushclicks = [False, False]
+            
+        # Left click draws square
+        elif (event.button == 1 and 
+              (event.xdata != None and event.ydata != None) 
+              and self.ax == event.inaxes):
+            tempx = int(event.xdata)
+            tempy = int(event.ydata)
+            
+            bbox = Brush.stroke(self.plotmask, tempx, tempy, tempx, tempy, 
+                                self.cellval, radius)
+            self.storebrushclicks = [tempx,tempy]
+            if bbox is not None:
+                self.stroke_bbox = union_bbox(self.stroke_bbox, bbox)
+                self.ScheduleRedraw(bbox)
+            
+        else:
+            return
+        
+        
+    def multiple_click(self, event, call_after, radius=3):
+        """Function to keep track of multiple left clicks, confirmed with 
+        a right click. After right click, the function call_after is called"""        
+        
+        if (event.button == 1  # left click
+            and (event.xdata != None and event.ydata != None) 
+            and self.ax == event.inaxes):
+            
+            newx = int(event.xdata)
+            newy = int(event.ydata)
+            self.storemouseclicks.append((newx, newy))
+            
+            self.updateplot(newx, newy, False)
+        
+        elif (event.button == 3): # right click
+            call_after()
+
+            
+    
+    def PaintBrush(self, event, radius=3):
+        """PantBrush is the method to paint using a "brush" and it is based
+        on the mouse event in matplotlib "motion notify event". However it can 
+        not record every pixel that the mouse has hovered over (it is too fast).
+        So, in order to not only draw points (happens when the mouse is dragged
+        too quickly), these points are interpolated here with lines.
+        Only the bounding box of the line is painted and redrawn.
+        """
+        if (event.button == 1 
+            and (event.xdata != None and event.ydata != None) 
+            and self.ax == event.inaxes):
+            newx = int(event.xdata)
+            newy = int(event.ydata)
+            # when a new cell value is set, there is no point to interpolate, to
+            # draw a line between the points. 
+            if self.storebrushclicks[0] == False :
+                self.storebrushclicks = [newx,newy]
+                
+            else:
+                oldx, oldy = self.storebrushclicks
+                
+                bbox = Brush.stroke(self.plotmask, newx, newy, oldx, oldy,
+                                    self.cellval, radius)
+                if bbox is not None:
+                    self.stroke_bbox = union_bbox(self.stroke_bbox, bbox)
+                    self.ScheduleRedraw(bbox)
+                
+            self.storebrushclicks = [newx, newy]
+            
+            
+    def MouseClick(self,event):
+        """This function is called whenever the add region or the new cell
+        buttons are active and the user clicks on the plot. For each 
+        click on the plot, it records the coordinate of the click and stores
+        it. When the user deactivate the new cell or add region button, 
+        all the coordinates are given to the DrawRegion function (if they 
+        do not all lie on the same line) and out of the coordinates, it makes
+        a polygon. And then draws inside of this polygon by setting the pixels
+        to the self.cellval value.
+        """
+        # button == 1 corresponds to the left click. 
+        if (event.button == 1 
+            and (event.xdata != None and event.ydata != None) 
+            and self.ax == event.inaxes):
+            
+            # extract the coordinate of the click inside of the matplotlib figure
+            # and then takes the integer part
+            newx = int(event.xdata)
+            newy = int(event.ydata)
+            
+            # stores the coordinates of the click
+            self.storemouseclicks.append((newx, newy))
+            
+            # draws in the figure a small square (4x4 pixels) to
+            # visualize where the user has clicked
+            self.updateplot(newx, newy)
+                
+
+    def DefineColormap(self, Ncolors):
+       """Define a new colormap by assigning 10 values of the jet colormap
+        such that there are only colors for the values 0-10 and the values >10
+        will be treated with a modulo operation (updatedata function)
+       """
+       jet = cm.get_cmap('jet', Ncolors)
+       colors = []
+       for i in range(0,Ncolors):
+           if i==0 : 
+               # set background transparency to 0
+               temp = list(jet(i))
+               temp[3]= 0.0
+               colors.append(tuple(temp))
+               
+           else:
+               colors.append(jet(i))
+               
+       colormap = ListedColormap(colors)
+       return colormap
+           
+    
+    def MaskChanged(self, mask=None):
+        """Marks mask (default: all the masks) as changed, such that its 
+        cached cell centers are recomputed"""
+        if mask is None:
+            self.centers.clear()
+        else:
+            self.centers.pop(id(mask), None)
+        
+    
+    def _getCellCenters(self, plotmask):
+        """Get the locations of the cell centers (centers of mass), for all 
+        cells at once by summing the pixel coordinates per cell value. The 
+        result is cached until the mask is marked as changed."""
+        key = id(plotmask)
+        if key in self.centers and self.centers[key][0] is plotmask:
+            return self.centers[key][1]
+        
+        vals, sums = cf.cell_moments(plotmask, ('area', 'sum_r', 'sum_c'))
+        xtemp = np.rint(sums['sum_c'] / sums['area']).astype(int)
+        ytemp = np.rint(sums['sum_r'] / sums['area']).astype(int)
+        result = (vals.astype(int), xtemp, ytemp)
+        
+        self.centers[key] = (plotmask, result)
+        return result
+
+    
+    def updateplot(self, posx, posy, first_is_cell=True):
+        """
+        it updates the plot once the user clicks on the plot and draws a 4x4 pixel dot
+        at the coordinate of the click 
+        """        
+        if first_is_cell:
+            # remove the first coordinate as it should only coorespond 
+            # to the value that the user wants to attribute to the drawn region   
+            xtemp, ytemp = self.storemouseclicks[0]
+    
+            # here we initialize the value attributed to the pixels.
+            # it means that the first click selects the value that will be attributed to
+            # the pixels inside the polygon (drawn by the following mouse clicks of the user)
+            self.cellval = self.plotmask[ytemp, xtemp]
+            
+        else:
+            self.cellval=1
+          
+        # drawing the 2x2 square ot of the mouse click
+        if ((self.button_newcell_check.isChecked() or self.button_drawmouse_check.isChecked()) 
+            and self.cellval == 0):
+            self.tempmask[posy:posy+2, posx:posx+2] = 9
+        else:
+            self.tempmask[posy:posy+2,posx:posx+2] = self.cellval
+
+        # plot the mouseclick
+        self.updatedata(False)
+          
+
+    def DrawRegion(self, flag):
+        """
+        this method is used to draw either a new cell (flag = true) or to add a region to 
+        an existing cell (flag = false). The flag will just be used to set the
+        value of pixels (= self.cellval) in the drawn region. 
+        If flag = true, then the value will be the maximal value plus 1. Such 
+        that it attributes a new value to the new cell.
+        If flag = false, then it will use the value of the first click to set
+        the value of the pixels in the new added region. 
+        Returns the bounding box of the drawn region, or None if nothing has
+        been drawn.
+        """
+        # here the values that have been changed to mark the mouse clicks are 
+        # restored such that they don't appear when the region/new cell is 
+        # drawn.        
+        if flag:
+            # if new cell is added, it sets the value of the drawn pixels to a new value
+            # corresponding to the new cell
+            self.cellval = np.amax(self.plotmask) + 1
+            
+        else:
+            # The first value is taken out as it is just used to set the value
+            # to the new region.
+            self.storemouseclicks.pop(0)
+        
+        if len(self.storemouseclicks) <= 2:
+            # if only two points or less have been click, it cannot make a area
+            # so it justs discards these values and returns. 
+            self.storemouseclicks = list(self.storemouseclicks)
+            self.storemouseclicks.clear()
+            self.updatedata(True)
+            return None
+        
+        else:
+            # Draw polygon, fill it with cell values within its bounding box
+            bbox = fill_polygon(self.plotmask, self.storemouseclicks, self.cellval)
+            self.updatedata()
+            
+        # empty the lists ready for the next region to be drawn.
+        self.storemouseclicks = []
+        return bbox
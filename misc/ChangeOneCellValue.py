@@ -3,7 +3,7 @@
 Created on Tue Nov 19 17:38:58 2019
 """
 
-from PyQt5.QtWidgets import QApplication, QMainWindow, QMenu, QVBoxLayout, QSizePolicy, QMessageBox, QWidget, QPushButton, QShortcut, QComboBox, QDialog, QDialogButtonBox, QInputDialog, QLineEdit, QFormLayout
+from PyQt5.QtWidgets import QApplication, QMainWindow, QMenu, QVBoxLayout, QSizePolicy, QMessageBox, QWidget, QPushButton, QShortcut, QComboBox, QDialog, QDialogButtonBox, QInputDialog, QLineEdit, QFormLayout, QCheckBox
 from PyQt5 import QtGui
 #from PyQt5.QtGui import QIcon, QKeySequence
 from PyQt5.QtCore import pyqtSignal, QObject, Qt
@@ -31,6 +31,9 @@ class CustomDialog(QDialog):
         flo.addRow('Enter Cell value (integer):', self.entry1)
 #        flo.addRow('Enter Cell value 2 (integer):', self.entry2)        
         
+        self.check_propagate = QCheckBox('Apply to all later time frames')
+        flo.addRow(self.check_propagate)
+        
         QBtn = QDialogButtonBox.Ok | QDialogButtonBox.Cancel
         
         self.buttonBox = QDialogButtonBox(QBtn)
@@ -9,13 +9,17 @@ import os
 import numpy as np
 from PyQt5.QtWidgets import (QApplication, QPushButton, QLabel,
                              QHBoxLayout, QVBoxLayout, QListWidget,
-                             QFileDialog, QMessageBox, QDialog)
+                             QFileDialog, QMessageBox, QDialog, QLineEdit,
+                             QAbstractItemView)
 from PyQt5.QtCore import Qt
+from PyQt5 import QtGui
 
 
 from PIL import Image, ImageDraw
 sys.path.append("../disk")
 from image_loader import load_image
+from table_writer import is_columnar, columnar_available
+from Polygon import polygon_mask
 
 #Import from matplotlib to use it to display the pictures and masks.
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
@@ -28,13 +32,17 @@ from matplotlib.figure import Figure
 class Extract(QDialog):
     
     
-    def __init__(self, image, mask, channel_names=[]):
+    def __init__(self, image, mask, channel_names=[], fov_names=['Field of View 1'],
+                 current_fov=0, sizet=1):
         parent = None
         super(Extract, self).__init__(parent)
         self.setWindowFlags(Qt.WindowStaysOnTopHint)
 #        image, mask = _test_data()
         self.pc = PlotCanvas(image, mask)
         self.file_list = channel_names
+        self.fov_names = fov_names
+        self.current_fov = current_fov
+        self.sizet = sizet
         self.init_UI()
         self.exit_code = 0 # 0: Cancel, 1: Fluorescence, 2: Mask
 
@@ -92,6 +100,30 @@ class Extract(QDialog):
         manage_box.addLayout(add_remove)
         manage_box.setAlignment(Qt.AlignTop)
         
+        # Fields of view and time range, for extracting values
+        range_title = QLabel("Fields of view and time frames:")
+        self.list_fov = QListWidget()
+        self.list_fov.setSelectionMode(QAbstractItemView.MultiSelection)
+        self.list_fov.addItems(self.fov_names)
+        self.list_fov.item(self.current_fov).setSelected(True)
+        self.list_fov.setToolTip("The selection of cells only applies to the "
+                                 "current field of view.")
+        self.entry_tstart = QLineEdit('0')
+        self.entry_tstart.setValidator(QtGui.QIntValidator(0, self.sizet-1))
+        self.entry_tend = QLineEdit(str(self.sizet-1))
+        self.entry_tend.setValidator(QtGui.QIntValidator(0, self.sizet-1))
+        
+        time_range = QHBoxLayout()
+        time_range.addWidget(self.entry_tstart)
+        time_range.addWidget(QLabel('to'))
+        time_range.addWidget(self.entry_tend)
+        
+        range_box = QVBoxLayout()
+        range_box.addWidget(range_title)
+        range_box.addWidget(self.list_fov)
+        range_box.addLayout(time_range)
+        range_box.setAlignment(Qt.AlignTop)
+        
         # Button list
         self.buttons = [self.extr_mask,
                         self.extr_fluo,
@@ -102,12 +134,16 @@ class Extract(QDialog):
                         self.desel_sngl,
                         self.add_file,
                         self.remove_file,
-                        self.list_channels]
+                        self.list_channels,
+                        self.list_fov,
+                        self.entry_tstart,
+                        self.entry_tend]
         
         # Buttons
         buttons = QHBoxLayout()
         buttons.addLayout(sel_box)
         buttons.addLayout(manage_box)
+        buttons.addLayout(range_box)
         buttons.addLayout(extr_box)
         
         # Plot Canvas
@@ -127,19 +163,49 @@ class Extract(QDialog):
     def do_extr_fluo(self):
         self.outfile, _ = QFileDialog.getSaveFileName(
             self,"Specify CSV file for exporting values",
-            "","All files (*);;Text files (*.csv)")
+            "","All files (*);;Text files (*.csv);;Parquet files (*.parquet)"
+            ";;Feather files (*.feather)")
         _, ext = os.path.splitext(self.outfile)
         if ext == '':
             self.outfile += '.csv'
-        elif ext != '.csv':
-            QMessageBox.critical(self,'Error','Must specify .csv file')
+        elif ext != '.csv' and not is_columnar(self.outfile):
+            QMessageBox.critical(self,'Error',
+                                 'Must specify .csv, .parquet or .feather file')
+            return 
+        elif is_columnar(self.outfile) and not columnar_available():
+            QMessageBox.critical(self,'Error',
+                                 'Writing Parquet or Feather files requires '
+                                 'the package pyarrow')
             return 
         
+        if not self.read_range():
+            return
+        
         self.exit_code = 1
-        self.cells = self.pc.sellist
-        self.desel_cells = set(np.unique(self.pc.mask)) - set(self.cells)
+        self.cells = self.pc.selected_cells()
+        self.desel_cells = self.pc.deselected_cells()
         self.close()
 
+    def read_range(self):
+        """Reads the selected fields of view and the time range, returns 
+        False if they are not valid"""
+        self.fovs = sorted(self.list_fov.row(item) 
+                           for item in self.list_fov.selectedItems())
+        if len(self.fovs) == 0:
+            QMessageBox.critical(self, 'Error', 'No field of view selected')
+            return False
+        
+        if self.entry_tstart.text() == '' or self.entry_tend.text() == '':
+            QMessageBox.critical(self, 'Error', 'No time range specified')
+            return False
+        tstart = int(self.entry_tstart.text())
+        tend = int(self.entry_tend.text())
+        if tstart > tend:
+            QMessageBox.critical(self, 'Error', 'Invalid time range')
+            return False
+        self.times = list(range(tstart, tend+1))
+        return True
+
     def do_cancel(self):
         self.close()
     
@@ -155,8 +221,8 @@ class Extract(QDialog):
             return 
 
         self.exit_code = 2
-        self.cells = self.pc.sellist
-        self.desel_cells = set(np.unique(self.pc.mask)) - set(self.cells)
+        self.cells = self.pc.selected_cells()
+        self.desel_cells = self.pc.deselected_cells()
         self.close()
                 
     def do_sel_mult(self):
@@ -171,8 +237,7 @@ class Extract(QDialog):
         
     def do_sel_mult_process(self):
         """Process selecting multiple"""
-        cells = self.cells_in_polygon()
-        self.pc.sellist = self.pc.sellist.union(cells)
+        self.pc.select(self.cells_in_polygon())
         self.disconnect()
         
     def do_desel_mult(self):
@@ -187,17 +252,17 @@ class Extract(QDialog):
         
     def do_desel_mult_process(self):
         """Process deselect multiple"""
-        cells = self.cells_in_polygon()
-        self.pc.sellist = self.pc.sellist - cells
+        self.pc.deselect(self.cells_in_polygon())
         self.disconnect()
         
     def cells_in_polygon(self):
-        """Extracts cells inside of polygon specified by pc.storemouseclicks"""
-        nx, ny = self.pc.mask.shape
-        img = Image.new('L', (ny, nx), 0)
-        ImageDraw.Draw(img).polygon(self.pc.storemouseclicks, outline=1, fill=1)
-        polygon = np.array(img).astype(bool)
-        return set(np.unique(self.pc.mask[polygon]))
+        """Extracts cells inside of polygon specified by pc.storemouseclicks.
+        The polygon is only rasterized within its bounding box."""
+        if len(self.pc.storemouseclicks) == 0:
+            return set()
+        window, polygon = polygon_mask(self.pc.storemouseclicks, 
+                                       self.pc.mask.shape)
+        return set(np.unique(self.pc.mask[window][polygon]))
     
     def do_sel_sngl(self):
         """Select single cell"""
@@ -211,8 +276,7 @@ class Extract(QDialog):
     def do_sel_sngl_process(self, x, y):
         """Process selected cell"""
         if x is not None:
-            cell = self.pc.mask[y,x]
-            self.pc.sellist.add(cell)
+            self.pc.select([self.pc.mask[y,x]])
         self.disconnect()
     
     def do_desel_sngl(self):
@@ -227,8 +291,7 @@ class Extract(QDialog):
     def do_desel_sngl_process(self, x, y):
         """Process deselected cell"""
         if x is not None:
-            cell = self.pc.mask[y,x]
-            self.pc.sellist.remove(cell)
+            self.pc.deselect([self.pc.mask[y,x]])
         self.disconnect()
             
     def disconnect(self):
@@ -294,9 +357,18 @@ class PlotCanvas(FigureCanvas):
         self.setParent(parent)
         
         self.image = image
+        if not np.issubdtype(mask.dtype, np.integer):
+            mask = mask.astype(np.int64)
         self.mask = mask
-        self.sellist = set(np.unique(mask)) # selected cells
-        self.vismask = mask.copy() # mask with only selected cells
+        self.cells = np.unique(mask)
+        self.cells = self.cells[self.cells != 0]
+        
+        # lookup tables indexed by cell value: whether the cell is selected,
+        # and the color index of the cell in the plot
+        labels = np.arange(int(mask.max(initial=0)) + 1)
+        self.selected = labels != 0
+        self.colors = ((labels%10+1)*(labels != 0)).astype(np.uint8)
+        self.vismask = self.colors[mask] # colors of the selected cells
         
         self.ax_image, self.ax_mask = self.initialize_plots(image, mask, self.ax)        
         self.storemouseclicks = []
@@ -347,25 +419,43 @@ class PlotCanvas(FigureCanvas):
         it updates the plot once the user clicks on the plot and draws a 4x4 pixel dot
         at the coordinate of the click 
         """     
-        self.vismask[posy:posy+2, posx:posx+2] = 9
+        self.vismask[posy:posy+2, posx:posx+2] = 10
         self.redraw_mask()
 
     def redraw_mask(self):
         """Redraw mask with current self.vismask"""
-        self.ax_mask.set_data((self.vismask%10+1)*(self.vismask!=0))
+        self.ax_mask.set_data(self.vismask)
         self.ax.draw_artist(self.ax_image)
         self.ax.draw_artist(self.ax_mask)
         self.update()
         self.flush_events()
 
+    def select(self, cells):
+        """Adds the cells to the selection"""
+        self._set_selected(cells, True)
+
+    def deselect(self, cells):
+        """Removes the cells from the selection"""
+        self._set_selected(cells, False)
+
+    def _set_selected(self, cells, value):
+        cells = np.array([c for c in cells if 0 < c < len(self.selected)], 
+                         dtype=np.int64)
+        self.selected[cells] = value
+
+    def selected_cells(self):
+        """Returns the set of selected cells"""
+        return set(self.cells[self.selected[self.cells]])
+
+    def deselected_cells(self):
+        """Returns the set of the cells of the mask which are not selected"""
+        return set(self.cells[~self.selected[self.cells]])
+
     def recalculate_vismask(self):
-        """Recalculates vismask with current list of cells to show"""
-        tmp = self.mask.copy()
-        all_cells = set(np.unique(tmp))
-        to_remove = all_cells - self.sellist
-        for cell in to_remove:
-            tmp[tmp==cell] = 0
-        self.vismask = tmp
+        """Recalculates vismask with current selection of cells to show, 
+        in one lookup over the pixels"""
+        lut = np.where(self.selected, self.colors, 0).astype(np.uint8)
+        np.take(lut, self.mask, out=self.vismask)
 
     def update_plots(self):
         """Shows plot with currently selected cells"""
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Extraction of the cell statistics of several fields of view, channels and
+time frames. Every (field of view, time) unit is processed in a separate
+process, which reads its mask and images once.
+"""
+import os
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+import pandas as pd
+
+from image_loader import load_image
+from relabel import remove_cells
+from cell_statistics import CellStatistics
+import cell_features as cf
+from table_writer import TableWriter, is_columnar
+
+
+def extract_frame(reader, fov, t, channel_list, desel_cells, sel_cells):
+    """Calculates the statistics of all cells of the mask at time t and field
+    of view fov, for every channel of channel_list (names of channels of the
+    image file, or paths of additional image files). Cells in desel_cells
+    are disregarded, cells not in sel_cells are flagged as disappeared.
+    Returns a DataFrame, or None if there is no mask. The geometry of the
+    cells is taken from the stored table of cell features."""
+    mask = reader.ReadMask(t, fov)
+    if mask is None:
+        return None
+
+    mask = remove_cells(mask, desel_cells, out=mask)
+    features = cf.remove_features(reader.ReadFeatures(t, fov), desel_cells)
+    cellstats = CellStatistics(mask, features)
+
+    frame_list = []
+    for channel in channel_list:
+        # check if channel is in list of nd2 channels
+        try:
+            channel_ix = reader.channel_names.index(channel)
+            image = reader.LoadImageChannel(t, fov, channel_ix)
+
+        # channel is a file
+        except ValueError:
+            image = load_image(channel, ix=t)
+
+        stats = pd.DataFrame({'Cell': cellstats.cells,
+                              'Time': t,
+                              'Channel': channel,
+                              **cellstats.statistics(image)})
+        stats['Disappeared in video'] = ~np.isin(cellstats.cells, list(sel_cells))
+        frame_list.append(stats)
+
+    return pd.concat(frame_list, ignore_index=True)
+
+
+def last_cells(reader, fov, times):
+    """Returns the set of cells of the last non-empty mask of the field of
+    view in the list times, which are the cells that did not disappear."""
+    for t in sorted(times, reverse=True):
+        features = reader.ReadFeatures(t, fov)
+        if features is not None and len(features) > 0:
+            return set(features['label'])
+    return set()
+
+
+class _Cancelled(Exception):
+    """Raised to abort the extraction when the user cancels it"""
+
+
+def _merge(frame_list, multiple_fovs):
+    """Concatenates the DataFrames of all units into one table, sorted by
+    cell and time"""
+    if not frame_list:
+        return pd.DataFrame()
+
+    df = pd.concat(frame_list, ignore_index=True)
+    sort_by = ['FOV', 'Cell', 'Time'] if multiple_fovs else ['Cell', 'Time']
+    return df.sort_values(sort_by, kind='stable')
+
+
+def extract(reader, fovs, times, channel_list, outfile, selections={},
+            progress=None, is_cancelled=None, max_workers=None):
+    """Extracts the statistics of all cells for the fields of view fovs, the
+    time frames times and the channels in channel_list (see extract_frame),
+    and saves them to outfile.
+    selections maps a field of view to the tuple (sel_cells, desel_cells)
+    chosen by the user; for the other fields of view all cells are taken,
+    and the cells of the last mask are considered as selected.
+
+    The (field of view, time) units are processed by a pool of max_workers
+    processes (default: one per unit, at most one per CPU). Only a few units
+    more than the number of processes are submitted (or kept in memory,
+    when finished before the preceding ones) at once. progress(done, total)
+    is called whenever a unit is finished, and the extraction is aborted 
+    (returning False, and removing outfile) if is_cancelled() returns True.
+
+    If outfile is a Parquet or Feather file (see table_writer), the results
+    of every unit are appended to it as soon as all preceding units are
+    done, such that the table is written in a deterministic order without
+    being kept in memory, and always contains a column FOV. Otherwise, a csv
+    file sorted by cell and time is written, with a column FOV only if
+    several fields of view are extracted. Returns True if the file was
+    written."""
+    selections = dict(selections)
+    for fov in fovs:
+        if fov not in selections:
+            selections[fov] = (last_cells(reader, fov, times), set())
+
+    units = [(fov, t) for fov in fovs for t in times]
+    multiple_fovs = len(fovs) > 1
+    writer = TableWriter(outfile, channel_list) if is_columnar(outfile) else None
+    frame_list = []
+    pending = {}
+    next_unit = 0
+    done = 0
+
+    def store(fov, df):
+        if df is None:
+            return
+        if writer is not None:
+            writer.write(df, fov)
+        else:
+            if multiple_fovs:
+                df.insert(0, 'FOV', fov)
+            frame_list.append(df)
+
+    if max_workers is None:
+        max_workers = min(len(units), os.cpu_count() or 1)
+    max_workers = max(max_workers, 1)
+    window = 2 * max_workers
+
+    # spawn fresh processes, forking the GUI with its threads is not safe
+    context = multiprocessing.get_context('spawn')
+    try:
+        with ProcessPoolExecutor(max_workers, mp_context=context) as executor:
+            futures = {}
+            submitted = 0
+            while futures or submitted < len(units):
+                # the units are submitted in order, as long as the window of
+                # running and finished but not yet stored units is not full
+                while submitted < len(units) and len(futures) + len(pending) < window:
+                    fov, t = units[submitted]
+                    sel_cells, desel_cells = selections[fov]
+                    future = executor.submit(extract_frame, reader, fov, t,
+                                             channel_list, desel_cells, sel_cells)
+                    futures[future] = (fov, t)
+                    submitted += 1
+
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                if is_cancelled is not None and is_cancelled():
+                    for f in futures:
+                        f.cancel()
+                    raise _Cancelled()
+
+                for future in finished:
+                    pending[futures.pop(future)] = future.result()
+                    done += 1
+
+                # store the finished units in the order of units
+                while next_unit < len(units) and units[next_unit] in pending:
+                    fov, t = units[next_unit]
+                    store(fov, pending.pop((fov, t)))
+                    next_unit += 1
+
+                if progress is not None:
+                    progress(done, len(units))
+
+    except _Cancelled:
+        if writer is not None:
+            writer.close()
+            os.remove(outfile)
+        return False
+
+    except Exception:
+        if writer is not None:
+            writer.close()
+        raise
+
+    if writer is not None:
+        writer.close()
+    else:
+        _merge(frame_list, multiple_fovs).to_csv(outfile, index=False)
+    return True
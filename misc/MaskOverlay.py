@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Colored overlay of a mask, shown as an RGBA image on top of a frame. The
+colors of the cells are looked up in a precomputed uint8 table indexed by
+the cell value, such that no colormapping is done by matplotlib and no
+temporary arrays are allocated when the mask changes.
+"""
+import numpy as np
+
+
+# cell values up to this size are looked up directly, larger ones through
+# their value modulo the number of colors
+LUT_SIZE = 2**16
+
+
+def label_lut(colormap, ncolors=10, alpha=0.2):
+    """Returns the RGBA (uint8) lookup tables of the cell values. Cell value
+    v is colored as the value v%ncolors+1 of colormap on the scale 0 to
+    ncolors, with the transparency alpha, and the background is transparent.
+    The first table is indexed by the cell value, the second one by
+    v%ncolors+1 (0 for the background)."""
+    colors = np.zeros((ncolors+1, 4), dtype=np.uint8)
+    colors[1:] = colormap(np.arange(1, ncolors+1) / ncolors, bytes=True)
+    colors[1:, 3] = np.round(colors[1:, 3] * alpha)
+
+    labels = np.arange(LUT_SIZE)
+    lut = colors[(labels % ncolors + 1) * (labels != 0)]
+    return lut, colors
+
+
+class MaskOverlay:
+
+
+    def __init__(self, artist, colormap, ncolors=10, alpha=0.2):
+        """Draws masks into the RGBA image artist (as returned by imshow).
+        The colors are written directly into the array of the artist."""
+        self.artist = artist
+        self.ncolors = ncolors
+        self.lut, self.colors = label_lut(colormap, ncolors, alpha)
+
+
+    def buffer(self, shape):
+        """Returns the RGBA array of the artist, which is replaced by a new
+        array only if the shape of the mask has changed"""
+        data = np.ma.getdata(self.artist.get_array())
+        if data is None or data.shape != tuple(shape) + (4,) or data.dtype != np.uint8:
+            self.artist.set_data(np.zeros(tuple(shape) + (4,), dtype=np.uint8))
+            data = np.ma.getdata(self.artist.get_array())
+        return data
+
+
+    def _colorize(self, labels, out):
+        if labels.dtype in (np.uint8, np.uint16):
+            np.take(self.lut, labels, axis=0, out=out)
+        else:
+            labels = labels.astype(np.int64)
+            index = (labels % self.ncolors + 1) * (labels != 0)
+            np.take(self.colors, index, axis=0, out=out)
+
+
+    def set_mask(self, mask):
+        """Colors the whole mask"""
+        mask = np.asarray(mask)
+        self._colorize(mask, self.buffer(mask.shape))
+        self.artist.changed()
+
+
+    def update(self, mask, bbox):
+        """Colors only the bounding box (rmin, cmin, rmax, cmax) of mask,
+        where it has been edited. Artists which can repaint a part of
+        themselves (changed_bbox) repaint only this box."""
+        mask = np.asarray(mask)
+        r0, c0, r1, c1 = bbox
+        buf = self.buffer(mask.shape)
+        window = buf[r0:r1, c0:c1]
+        if window.size > 0:
+            colored = np.empty_like(window)
+            self._colorize(mask[r0:r1, c0:c1], colored)
+            window[...] = colored
+        if hasattr(self.artist, 'changed_bbox'):
+            self.artist.changed_bbox(bbox)
+        else:
+            self.artist.changed()
@@ -5,8 +5,6 @@ This file handles the PlotCanvas of the GUI - aka the area where the graphics
 are shown. 
 """
 import numpy as np
-from skimage import morphology as morph
-from skimage import draw
 
 # Import everything for the Graphical User Interface from the PyQt5 library.
 from PyQt5.QtWidgets import QSizePolicy
@@ -15,15 +13,14 @@ from PyQt5.QtWidgets import QSizePolicy
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 import matplotlib.pyplot as plt
 
-from matplotlib import cm
-from matplotlib.colors import ListedColormap
-#from matplotlib.path import Path
+from CanvasEditing import CanvasEditing
+from BlitRenderer import BlitRenderer
+from MaskOverlay import MaskOverlay
+from Pyramid import (ImagePyramid, downsample_nearest, choose_level, 
+                     visible_window, window_extent, level_bbox)
 
-from PIL import Image, ImageDraw
 
-
-
-class PlotCanvas(FigureCanvas):
+class PlotCanvas(CanvasEditing, FigureCanvas):
     
     
     
@@ -64,232 +61,75 @@ class PlotCanvas(FigureCanvas):
         self.currplot, self.currmask = self.plot(self.currpicture, self.plotmask, self.ax)
         
         self.previousplot, self.previousmask = self.plot(self.prevpicture, self.prevplotmask, self.ax2)
-        self.prevpicture = np.zeros([parent.reader.sizey, parent.reader.sizex], dtype = np.uint16)
+        self.prevpicture = parent.blankframe
         self.prevplotmask = np.zeros([parent.reader.sizey, parent.reader.sizex], dtype =np.uint16)
         
         self.nextplot, self.nextmask = self.plot(self.nextpicture, self.nextplotmask, self.ax3)
         self.previousplot.set_data(self.prevpicture)
-        self.previousmask.set_data((self.prevplotmask%10+1)*(self.prevplotmask != 0))
-
-        self.ax2.draw_artist(self.previousplot)
-        self.ax2.draw_artist(self.previousmask)
-        self.update()
-        self.flush_events()
-        
-        # Set title labels
-        self.titlecurr = self.ax.set_title('Time index {}'.format(parent.Tindex))
-        self.titleprev = self.ax2.set_title('No frame {}'.format(''))
-        self.titlenext = self.ax3.set_title('Next time index {}'.format(parent.Tindex+1))
-        
-        # these variables are just set to test the states of the buttons
-        # (button turned on or  off, etc..) of the buttons in the methods 
-        # used in this class.
-        self.button_showval_check = parent.button_showval
-        self.button_newcell_check = parent.button_newcell
-        self.button_add_region_check = parent.button_add_region
-        self.button_drawmouse_check = parent.button_drawmouse
-        self.button_eraser_check = parent.button_eraser
-        self.button_hidemask_check = parent.button_hidemask
         
-        # It will plot for the first time and return the imshow function
-        self.currmask.set_clim(0, 10)
-        self.previousmask.set_clim(0,10)
-        self.nextmask.set_clim(0,10)
-        
-        # This attribute is a list which stores all the clicks of the mouse.
-        self.storemouseclicks = []
-        
-        # This attribute is used to store the square where the mouse has been
-        # in order than to draw lines (Paintbrush function)
-        self.storebrushclicks = [False,False]
-        
-        # self.cellval is the variable which sets the value to the pixel
-        # whenever something is drawn.
-        self.cellval = 0
+        # the masks are colored through a lookup table directly into the 
+        # RGBA arrays of the mask images
+        colormap = self.DefineColormap(21)
+        self.curroverlay = MaskOverlay(self.currmask, colormap)
+        self.prevoverlay = MaskOverlay(self.previousmask, colormap)
+        self.nextoverlay = MaskOverlay(self.nextmask, colormap)
+        
+        # the frames and masks are shown at the level of their pyramids
+        # which matches the resolution of the screen, and only the window of 
+        # this level which is visible. The view is updated whenever the 
+        # limits of the axes change (zoom, pan, home, ...).
+        self.pyramids = {}
+        self.level = 0
+        self.window = (0, 0) + np.shape(self.plotmask)
+        self.shownmask = self.plotmask
+        self.shownview = None
+        self.changing_view = False
+        # the callbacks are connected on all the panels, since older 
+        # versions of matplotlib do not notify the shared axes
+        for ax in (self.ax, self.ax2, self.ax3):
+            ax.set_autoscale_on(False)
+            ax.callbacks.connect('xlim_changed', self.ViewChanged)
+            ax.callbacks.connect('ylim_changed', self.ViewChanged)
+        self.mpl_connect('resize_event', self.ViewChanged)
         
         # These are lists storing all the annotations which are used to
         # show the values of the cells on the plots.
         self.ann_list = []
         self.ann_list_prev = []
         self.ann_list_next = []
-
         
-    def ExchangeCellValue(self, val1, val2):
-        """Swaps the values of the cell between two clusters each representing
-        one cell. This method is called after the user has entered 
-        values in the ExchangeCellValues window.
-        """
-        if (val1 in self.plotmask) and (val2 in self.plotmask):
-            indices = np.where(self.plotmask == val1)
-            self.plotmask[self.plotmask == val2] = val1
-            for i in range(0,len(indices[0])):
-                self.plotmask[indices[0][i], indices[1][i]] = val2
-            self.updatedata()
-        else:
-            raise ValueError('Cell value does not exist.') 
+        # the masks and annotations of each panel are blitted on top of a 
+        # cached background, which contains the frame image, only for the
+        # panels which have changed
+        self.renderer = BlitRenderer(self)
+        self.renderer.add_panel(self.ax, 
+            lambda: [self.currmask] + self.ann_list)
+        self.renderer.add_panel(self.ax2, 
+            lambda: [self.previousmask] + self.ann_list_prev)
+        self.renderer.add_panel(self.ax3, 
+            lambda: [self.nextmask] + self.ann_list_next)
         
+        # Set title labels
+        self.titlecurr = self.ax.set_title('Time index {}'.format(parent.Tindex))
+        self.titleprev = self.ax2.set_title('No frame {}'.format(''))
+        self.titlenext = self.ax3.set_title('Next time index {}'.format(parent.Tindex+1))
         
-    def ReleaseClick(self, event):
-        """This method is called from the brush button when the mouse is 
-        released such that the last coordinate saved when something is drawn
-        is set to zero. Because otherwise, if the user starts drawing somewhere
-        else, than a straight line is draw between the last point of the
-        previous mouse drawing/dragging and the new one which then starts.
-        """
-        if self.ax == event.inaxes:
-            self.storebrushclicks = [False, False]
-            self.ShowCellNumbers()
+        self.InitEditing(parent)
+        self.ShowView()
 
         
-    def OneClick(self, event, radius=3):
-        """This method is called when the Brush button is activated. And
-        sets the value of self.cellval if the click is a right click, or draws
-        a square if the click is a left click. (so if the user does just left
-        click but does not drag, there will be only a square which is drawn )
-        """
-        selem = morph.disk(radius-1)
-        
-        # Right click selects cell
-        if (event.button == 3 
-            and (event.xdata != None and event.ydata != None) 
-            and (not self.button_eraser_check.isChecked()) 
-            and self.ax == event.inaxes):
-            tempx = int(event.xdata)
-            tempy = int(event.ydata)
-            self.cellval = self.plotmask[tempy, tempx]
-            self.storebrushclicks = [False, False]
-            
-        # Left click draws square
-        elif (event.button == 1 and 
-              (event.xdata != None and event.ydata != None) 
-              and self.ax == event.inaxes):
-            tempx = int(event.xdata)
-            tempy = int(event.ydata)
-            
-            to_change = np.zeros(self.plotmask.shape, dtype=bool)
-            to_change[tempy, tempx] = True
-            to_change = morph.dilation(to_change, selem)
-            
-            self.plotmask[to_change] = self.cellval
-            self.storebrushclicks = [tempx,tempy]
-            self.updatedata()
-            
-        else:
-            return
-        
-        
-    def multiple_click(self, event, call_after, radius=3):
-        """Function to keep track of multiple left clicks, confirmed with 
-        a right click. After right click, the function call_after is called"""        
-        
-        if (event.button == 1  # left click
-            and (event.xdata != None and event.ydata != None) 
-            and self.ax == event.inaxes):
-            
-            newx = int(event.xdata)
-            newy = int(event.ydata)
-            self.storemouseclicks.append((newx, newy))
-            
-            self.updateplot(newx, newy, False)
-        
-        elif (event.button == 3): # right click
-            call_after()
-
-            
-    
-    def PaintBrush(self, event, radius=3):
-        """PantBrush is the method to paint using a "brush" and it is based
-        on the mouse event in matplotlib "motion notify event". However it can 
-        not record every pixel that the mouse has hovered over (it is too fast).
-        So, in order to not only draw points (happens when the mouse is dragged
-        too quickly), these points are interpolated here with lines.
-        """
-        selem = morph.disk(radius-1)
-        if (event.button == 1 
-            and (event.xdata != None and event.ydata != None) 
-            and self.ax == event.inaxes):
-            newx = int(event.xdata)
-            newy = int(event.ydata)
-            # when a new cell value is set, there is no point to interpolate, to
-            # draw a line between the points. 
-            if self.storebrushclicks[0] == False :
-                self.storebrushclicks = [newx,newy]
-                
-            else:
-                oldx, oldy = self.storebrushclicks
-                
-                rr, cc, _ = draw.line_aa(newy, newx, oldy, oldx)
-                to_change = np.zeros(self.plotmask.shape, dtype=bool)
-                to_change[rr,cc] = True
-                to_change = morph.dilation(to_change, selem)
-                self.plotmask[to_change] = self.cellval
-                
-            self.storebrushclicks = [newx, newy]
-            self.updatedata()
-            
-            
-    def MouseClick(self,event):
-        """This function is called whenever the add region or the new cell
-        buttons are active and the user clicks on the plot. For each 
-        click on the plot, it records the coordinate of the click and stores
-        it. When the user deactivate the new cell or add region button, 
-        all the coordinates are given to the DrawRegion function (if they 
-        do not all lie on the same line) and out of the coordinates, it makes
-        a polygon. And then draws inside of this polygon by setting the pixels
-        to the self.cellval value.
-        """
-        # button == 1 corresponds to the left click. 
-        if (event.button == 1 
-            and (event.xdata != None and event.ydata != None) 
-            and self.ax == event.inaxes):
-            
-            # extract the coordinate of the click inside of the matplotlib figure
-            # and then takes the integer part
-            newx = int(event.xdata)
-            newy = int(event.ydata)
-            
-            # stores the coordinates of the click
-            self.storemouseclicks.append((newx, newy))
-            
-            # draws in the figure a small square (4x4 pixels) to
-            # visualize where the user has clicked
-            self.updateplot(newx, newy)
-                
-
-    def DefineColormap(self, Ncolors):
-       """Define a new colormap by assigning 10 values of the jet colormap
-        such that there are only colors for the values 0-10 and the values >10
-        will be treated with a modulo operation (updatedata function)
-       """
-       jet = cm.get_cmap('jet', Ncolors)
-       colors = []
-       for i in range(0,Ncolors):
-           if i==0 : 
-               # set background transparency to 0
-               temp = list(jet(i))
-               temp[3]= 0.0
-               colors.append(tuple(temp))
-               
-           else:
-               colors.append(jet(i))
-               
-       colormap = ListedColormap(colors)
-       return colormap
-           
-    
     def plot(self, picture, mask, ax):
        """this function is called for the first time when all the subplots
        are drawn.
+       The mask is shown as an RGBA image, which is colored by a MaskOverlay.
        """
-       # Define a new colormap with 20 colors.
-       newcmp = self.DefineColormap(21)
        ax.axis("off")
 
        self.draw()
        return (ax.imshow(picture, interpolation= 'None', 
-                         origin = 'upper', cmap = 'gray_r'), 
-               ax.imshow((mask%10+1)*(mask != 0), origin = 'upper', 
-                         interpolation = 'None', alpha = 0.2, cmap = newcmp))
+                         origin = 'upper', cmap = 'gray_r', vmin = 0, vmax = 255), 
+               ax.imshow(np.zeros(np.shape(mask) + (4,), dtype=np.uint8), 
+                         origin = 'upper', interpolation = 'None'))
    
     
     def UpdatePlots(self):
@@ -297,37 +137,90 @@ class PlotCanvas(FigureCanvas):
         Updates plots, handles mask and cell numbers.
         """
         
-        # Plot images
-        self.currplot.set_data(self.currpicture)
-        self.currplot.set_clim(np.amin(self.currpicture), np.amax(self.currpicture))
-        self.ax.draw_artist(self.currplot)
+        # Plot images and masks, the images are shown from their 8-bit 
+        # display buffers, scaled once between their display limits
+        self.shownmask = self.plotmask
+        self.ShowView()
         
-        self.previousplot.set_data(self.prevpicture)
-        self.previousplot.set_clim(np.amin(self.prevpicture), np.amax(self.prevpicture))
-        self.ax2.draw_artist(self.previousplot)
-            
-        self.nextplot.set_data(self.nextpicture)
-        self.nextplot.set_clim(np.amin(self.nextpicture), np.amax(self.nextpicture))
-        self.ax3.draw_artist(self.nextplot)
-        
-        # Plot masks
-        if not self.button_hidemask_check.isChecked():
-            self.currmask.set_data((self.plotmask%10+1)*(self.plotmask!=0))
-            self.previousmask.set_data((self.prevplotmask%10+1)*(self.prevplotmask != 0))
-            self.nextmask.set_data((self.nextplotmask % 10 +1 )*(self.nextplotmask != 0))
-            
-        else:
-            self.currmask.set_data(np.zeros(self.plotmask.shape))
-            self.previousmask.set_data(np.zeros(self.plotmask.shape))
-            self.nextmask.set_data(np.zeros(self.plotmask.shape))
+        # the masks of the panels may have been replaced
+        self.MaskChanged()
         
+        # redraw all panels, together with the cell numbers
         self.ShowCellNumbers()
-        self.draw()
-        self.update()
-        self.flush_events()
+        
+        
+    def GetPyramid(self, picture):
+        """Returns the pyramid of picture, which is computed only once for
+        the frames which are shown, with their display limits"""
+        pyramid = self.pyramids.get(id(picture))
+        if pyramid is None or pyramid.image is not picture:
+            pyramid = ImagePyramid(picture)
+        return pyramid
+        
+        
+    def MaskView(self, mask):
+        """Returns the visible window of the level of mask which is shown"""
+        r0, c0, r1, c1 = self.window
+        return downsample_nearest(mask, self.level)[r0:r1, c0:c1]
+        
+        
+    def CurrentView(self):
+        """Returns the level, the window and the extent (see Pyramid.py)
+        which match the current limits and size of the axes"""
+        xlim, ylim = self.ax.get_xlim(), self.ax.get_ylim()
+        shape = np.shape(self.currpicture)
+        maxlevel = len(self.GetPyramid(self.currpicture).levels) - 1
+        level = choose_level(xlim, ylim, self.ax.bbox.width, 
+                             self.ax.bbox.height, maxlevel)
+        window = visible_window(xlim, ylim, shape, level)
+        return level, window, window_extent(window, shape, level)
+        
+        
+    def ShowView(self):
+        """Shows the frames and the masks at the level of their pyramids
+        which matches the current zoom, and only the visible part of them.
+        Hidden masks are just not drawn."""
+        pyramids = [self.GetPyramid(picture) for picture in 
+                    (self.currpicture, self.prevpicture, self.nextpicture)]
+        self.pyramids = {id(p.image): p for p in pyramids}
+        
+        self.shownview = self.CurrentView()
+        self.level, self.window, extent = self.shownview
+        r0, c0, r1, c1 = self.window
+        
+        for artist, pyramid in zip((self.currplot, self.previousplot, self.nextplot), 
+                                   pyramids):
+            artist.set_data(pyramid.level(self.level)[r0:r1, c0:c1])
+            artist.set_extent(extent)
+        
+        visible = not self.button_hidemask_check.isChecked()
+        for artist in (self.currmask, self.previousmask, self.nextmask):
+            artist.set_visible(visible)
+        if visible:
+            self.curroverlay.set_mask(self.MaskView(self.shownmask))
+            self.prevoverlay.set_mask(self.MaskView(self.prevplotmask))
+            self.nextoverlay.set_mask(self.MaskView(self.nextplotmask))
+        for artist in (self.currmask, self.previousmask, self.nextmask):
+            artist.set_extent(extent)
+        # the images are part of the cached backgrounds
+        self.renderer.invalidate()
+        
+        
+    def ViewChanged(self, ax):
+        """Called when the limits of the axes change, to show the frames at
+        the level of the new zoom. The figure is redrawn by the toolbar.
+        The callback is called for every limit of every (shared) axis, the 
+        view is only shown again if it differs from the one shown."""
+        if self.changing_view or self.CurrentView() == self.shownview:
+            return
+        self.changing_view = True
+        try:
+            self.ShowView()
+        finally:
+            self.changing_view = False
                 
         
-    def updatedata(self, flag=True):
+    def updatedata(self, flag=True, bbox=None):
        """
        In order to just display the cells so regions with value > 0
        and also to assign to each of the cell values one color,
@@ -336,199 +229,85 @@ class PlotCanvas(FigureCanvas):
        gets with the addition the value 1) and the result of the 
        modulo is multiplied with a matrix containing a False value for the 
        background coordinates, setting the background to 0 again.
+       The colors are looked up in a table by the MaskOverlay. If bbox 
+       (rmin, cmin, rmax, cmax) is given, only this edited part of the 
+       overlay is updated. Only the shown level and window of the mask 
+       (see ShowView) are colored.
        """
-       if flag:
-           self.currmask.set_data((self.plotmask%10+1)*(self.plotmask!=0))
+       mask = self.plotmask if flag else self.tempmask
+       self.shownmask = mask
+       if bbox is None:
+           self.curroverlay.set_mask(self.MaskView(mask))
        else:
-           self.currmask.set_data((self.tempmask%10+1)*(self.tempmask!=0))
+           # the edited part of the level and window which are shown
+           bbox = level_bbox(bbox, self.window, self.level)
+           if bbox is not None:
+               self.curroverlay.update(self.MaskView(mask), bbox)
        
-       # show the updates by redrawing the array using draw_artist, it is faster 
-       # to use as it only redraws the array itself, and not everything else.
-       self.ax.draw_artist(self.currplot)
-       self.ax.draw_artist(self.currmask)
-       self.ShowCellNumbers()
-       self.update()
-       # self.flush_events()
+       # show the updates by blitting only the current panel, the other 
+       # panels have not changed.
+       self.MaskChanged(self.plotmask)
+       if self.button_showval_check.isChecked():
+           self.ShowCellNumbersCurr()
+       self.renderer.mark_dirty(self.ax)
+       self.renderer.render()
               
         
     def HideMask(self):
         self.UpdatePlots()
         
                  
-    def _getCellCenters(self, plotmask):
-        """Get approximate locations for cell centers"""
-        vals = np.unique(plotmask).astype(int)
-        vals = np.delete(vals,np.where(vals==0)) 
-        xtemp = []
-        ytemp = []
-        for k in vals:
-            y,x = (plotmask==k).nonzero()
-            sample = np.random.choice(len(x), size=20, replace=True)
-            meanx = np.mean(x[sample])
-            meany = np.mean(y[sample])
-            xtemp.append(int(round(meanx)))
-            ytemp.append(int(round(meany)))
-        return vals, xtemp, ytemp
-
-    
     def ShowCellNumbers(self):
         """Checks whether to show cell numbers, and does so if button is 
         checked"""
+        self.MaskChanged(self.plotmask)
         if self.button_showval_check.isChecked():
             self.ShowCellNumbersCurr()
             self.ShowCellNumbersNext()
             self.ShowCellNumbersPrev()
         else:
             self.clearAnnLists()
+        self.renderer.render()
+        
+    
+    def _placeNumbers(self, ax, ann_list, plotmask):
+        """Shows the values of the cells of plotmask at their centers. The 
+        text artists of ann_list are a pool which is reused: they are only 
+        moved and retexted, new ones are created only when there are more 
+        cells than artists, and the extra ones are hidden."""
+        vals, xtemp, ytemp = self._getCellCenters(plotmask)
+        for i in range(len(ann_list), len(vals)):
+            ann_list.append(ax.text(0, 0, '', ha='center', va='center', 
+                                    clip_on=True, animated=True))
+        for ann, val, x, y in zip(ann_list, vals, xtemp, ytemp):
+            ann.set_text(str(val))
+            ann.set_position((x, y))
+            ann.set_visible(True)
+        for ann in ann_list[len(vals):]:
+            ann.set_visible(False)
+        self.renderer.mark_dirty(ax)
         
     
     def ShowCellNumbersCurr(self):
-         """This function is called to display the cell values and it 
-         takes 10 random points inside of the cell, computes the mean of these
-         points and this gives the coordinate where the number will be 
-         displayed. The number to be displayed is just given by the value
-         in the mask of the cell.
-         This function is just used for the current time subplot.
-         """         
-         
-         for i,a in enumerate(self.ann_list):
-             a.remove()
-         self.ann_list[:] = []
-         
-         vals, xtemp, ytemp = self._getCellCenters(self.plotmask)
-         if xtemp:
-             for i in range(0,len(xtemp)):
-                 ann = self.ax.annotate(str(int(vals[i])), (xtemp[i], ytemp[i]),
-                                          ha='center', va='center')
-                 self.ann_list.append(ann)
+         """This function is called to display the cell values at the 
+         centers of the cells of the current time subplot. The number to be 
+         displayed is just given by the value in the mask of the cell.
+         """
+         self._placeNumbers(self.ax, self.ann_list, self.plotmask)
                      
              
     def ShowCellNumbersPrev(self):
-         """This function is called to display the cell values and it 
-         takes 10 random points inside of the cell, computes the mean of these
-         points and this gives the coordinate where the number will be 
-         displayed. The number to be displayed is just given by the value
-         in the mask of the cell.
-         This function is just used for the previous time subplot.
-         """
-         
-         for i,a in enumerate(self.ann_list_prev):
-             a.remove()
-         self.ann_list_prev[:] = []
-         
-         vals, xtemp, ytemp = self._getCellCenters(self.prevplotmask)
-     
-         if xtemp:
-             for i in range(0,len(xtemp)):
-                  ann = self.ax2.annotate(str(vals[i]), (xtemp[i], ytemp[i]),
-                                          ha='center', va='center')
-                  self.ann_list_prev.append(ann)
-         self.draw()
+         """Displays the cell values for the previous time subplot."""
+         self._placeNumbers(self.ax2, self.ann_list_prev, self.prevplotmask)
              
              
     def ShowCellNumbersNext(self):
-         """This function is called to display the cell values and it 
-         takes 10 random points inside of the cell, computes the mean of these
-         points and this gives the coordinate where the number will be 
-         displayed. The number to be displayed is just given by the value
-         in the mask of the cell.
-         This function is just used for the next time subplot.
-         """
-         for i,a in enumerate(self.ann_list_next):
-             a.remove()
-         self.ann_list_next[:] = []
-                     
-         vals, xtemp, ytemp = self._getCellCenters(self.nextplotmask)
-                 
-         if xtemp:
-             for i in range(0,len(xtemp)):
-                 ann = self.ax3.annotate(str(vals[i]), (xtemp[i], ytemp[i]),
-                                          ha='center', va='center')
-                 self.ann_list_next.append(ann)
-         self.draw()
+         """Displays the cell values for the next time subplot."""
+         self._placeNumbers(self.ax3, self.ann_list_next, self.nextplotmask)
         
         
     def clearAnnLists(self):
-        for ann in self.ann_list:
-            ann.remove()
-        self.ann_list = []
-        for ann in self.ann_list_prev:
-            ann.remove()
-        self.ann_list_prev = []
-        for ann in self.ann_list_next:
-            ann.remove()
-        self.ann_list_next = []
-        
-        
-    def updateplot(self, posx, posy, first_is_cell=True):
-        """
-        it updates the plot once the user clicks on the plot and draws a 4x4 pixel dot
-        at the coordinate of the click 
-        """        
-        if first_is_cell:
-            # remove the first coordinate as it should only coorespond 
-            # to the value that the user wants to attribute to the drawn region   
-            xtemp, ytemp = self.storemouseclicks[0]
-    
-            # here we initialize the value attributed to the pixels.
-            # it means that the first click selects the value that will be attributed to
-            # the pixels inside the polygon (drawn by the following mouse clicks of the user)
-            self.cellval = self.plotmask[ytemp, xtemp]
-            
-        else:
-            self.cellval=1
-          
-        # drawing the 2x2 square ot of the mouse click
-        if ((self.button_newcell_check.isChecked() or self.button_drawmouse_check.isChecked()) 
-            and self.cellval == 0):
-            self.tempmask[posy:posy+2, posx:posx+2] = 9
-        else:
-            self.tempmask[posy:posy+2,posx:posx+2] = self.cellval
-
-        # plot the mouseclick
-        self.updatedata(False)
-          
-
-    def DrawRegion(self, flag):
-        """
-        this method is used to draw either a new cell (flag = true) or to add a region to 
-        an existing cell (flag = false). The flag will just be used to set the
-        value of pixels (= self.cellval) in the drawn region. 
-        If flag = true, then the value will be the maximal value plus 1. Such 
-        that it attributes a new value to the new cell.
-        If flag = false, then it will use the value of the first click to set
-        the value of the pixels in the new added region. 
-        """
-        # here the values that have been changed to mark the mouse clicks are 
-        # restored such that they don't appear when the region/new cell is 
-        # drawn.        
-        if flag:
-            # if new cell is added, it sets the value of the drawn pixels to a new value
-            # corresponding to the new cell
-            self.cellval = np.amax(self.plotmask) + 1
-            
-        else:
-            # The first value is taken out as it is just used to set the value
-            # to the new region.
-            self.storemouseclicks.pop(0)
-        
-        if len(self.storemouseclicks) <= 2:
-            # if only two points or less have been click, it cannot make a area
-            # so it justs discards these values and returns. 
-            self.storemouseclicks = list(self.storemouseclicks)
-            self.storemouseclicks.clear()
-            self.updatedata(True)
-            return
-        
-        else:
-            # Draw polygon, fill it with cell values
-            nx, ny = self.plotmask.shape
-            img = Image.new('L', (ny, nx), 0)
-            ImageDraw.Draw(img).polygon(self.storemouseclicks, outline=1, fill=1)
-            polygon = np.array(img).astype(bool)
-            self.plotmask[polygon] = self.cellval
-            self.updatedata()
-            
-        # empty the lists ready for the next region to be drawn.
-        self.storemouseclicks = []
-        
\ No newline at end of file
+        """Hides all the cell values, the text artists are kept for reuse"""
+        for ann in self.ann_list + self.ann_list_prev + self.ann_list_next:
+            ann.set_visible(False)
+        self.renderer.mark_dirty()
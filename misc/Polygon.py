@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Rasterization of the polygons drawn by the user (new cell, add region, split
+cell, selection of cells to extract). The polygon is only rasterized within
+its bounding box, which is written through a view of the mask, such that no
+full-frame image is allocated.
+
+Running this file compares it to the rasterization of the whole frame.
+"""
+import numpy as np
+from PIL import Image, ImageDraw
+
+
+def polygon_mask(polygon, shape):
+    """Rasterizes polygon (list of (x, y) vertices) only within its bounding
+    box, clipped to an image of the given shape. Returns the slices of the
+    bounding box in the image and the boolean mask of the polygon within
+    it."""
+    xs, ys = zip(*polygon)
+    x0, x1 = max(int(min(xs)), 0), min(int(max(xs)) + 1, shape[1])
+    y0, y1 = max(int(min(ys)), 0), min(int(max(ys)) + 1, shape[0])
+    window = (slice(y0, max(y1, y0)), slice(x0, max(x1, x0)))
+    if x1 <= x0 or y1 <= y0:
+        return window, np.zeros((max(y1-y0, 0), max(x1-x0, 0)), dtype=bool)
+
+    img = Image.new('L', (x1-x0, y1-y0), 0)
+    ImageDraw.Draw(img).polygon([(x-x0, y-y0) for x, y in polygon],
+                                outline=1, fill=1)
+    return window, np.array(img).astype(bool)
+
+
+def fill_polygon(mask, polygon, value, only=None):
+    """Sets the pixels of mask inside polygon to value, in place. If only is
+    given, only the pixels of the cell only are changed. Returns the
+    bounding box (rmin, cmin, rmax, cmax) of the polygon, or None if it lies
+    outside of mask."""
+    window, inside = polygon_mask(polygon, mask.shape)
+    if inside.size == 0:
+        return None
+    view = mask[window]
+    if only is not None:
+        inside &= view == only
+    view[inside] = value
+    return window[0].start, window[1].start, window[0].stop, window[1].stop
+
+
+def _fill_full_frame(mask, polygon, value):
+    """Rasterization of the whole frame, for the benchmark"""
+    img = Image.new('L', (mask.shape[1], mask.shape[0]), 0)
+    ImageDraw.Draw(img).polygon(polygon, outline=1, fill=1)
+    mask[np.array(img).astype(bool)] = value
+
+
+if __name__ == '__main__':
+    import timeit
+
+    # a polygon of the size of a cell, drawn with a few clicks
+    polygon = [(200, 200), (240, 210), (250, 250), (215, 260), (195, 235)]
+    for size in (512, 2048, 8192):
+        mask = np.zeros((size, size), dtype=np.uint16)
+        n = 20
+        full = timeit.timeit(lambda: _fill_full_frame(mask, polygon, 1), number=n) / n
+        bbox = timeit.timeit(lambda: fill_polygon(mask, polygon, 1), number=n) / n
+        print('{0}x{0}: full frame {1:8.3f} ms, bounding box {2:8.3f} ms'
+              .format(size, full*1e3, bbox*1e3))
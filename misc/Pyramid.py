@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Multi-resolution display of large frames. Level k of a pyramid is the frame
+downsampled by 2**k: the intensities are averaged over blocks of pixels and
+the masks (labels) are sampled at the nearest pixel, which is a strided view
+of the mask and therefore always up to date with the edits. The canvas
+shows the level whose resolution matches the screen, and only the part of
+it which is visible.
+
+The intensities are stored as 8-bit display buffers, scaled between display
+limits which are computed once per frame from the percentiles of a
+subsample of the frame.
+"""
+import numpy as np
+
+
+# the coarsest level is not smaller than this in both dimensions
+MIN_SIZE = 256
+
+# percentiles of the intensities shown as the ends of the colormap
+DISPLAY_PERCENTILES = (0.1, 99.9)
+
+# approximate number of pixels sampled to compute the display limits
+LIMIT_SAMPLES = 2**16
+
+# number of rows converted at once to the display buffer
+CHUNK_ROWS = 256
+
+
+def display_limits(image, percentiles=DISPLAY_PERCENTILES):
+    """Returns the intensities (low, high) shown as the ends of the 
+    colormap, from the percentiles of a regular subsample of image"""
+    image = np.asarray(image)
+    step = max(int(np.ceil(np.sqrt(image.size / LIMIT_SAMPLES))), 1)
+    sample = image[::step, ::step]
+    if sample.size == 0:
+        return 0., 1.
+    low, high = np.percentile(sample, percentiles)
+    if high <= low:
+        high = low + 1
+    return float(low), float(high)
+
+
+def to_display(image, limits):
+    """Returns image scaled to uint8 between limits (low, high), clipped
+    outside of them"""
+    image = np.asarray(image)
+    low, high = limits
+    scale = 255 / (high - low)
+    out = np.empty(image.shape, dtype=np.uint8)
+    for r in range(0, image.shape[0], CHUNK_ROWS):
+        chunk = image[r:r+CHUNK_ROWS].astype(np.float32)
+        chunk -= low
+        chunk *= scale
+        np.clip(chunk, 0, 255, out=chunk)
+        np.rint(chunk, out=chunk)
+        out[r:r+CHUNK_ROWS] = chunk
+    return out
+
+
+def downsample_mean(image):
+    """Returns image downsampled by 2, each pixel being the mean of a 2x2
+    block (odd sizes are extended by repeating the last row/column)"""
+    image = np.asarray(image, dtype=np.float32)
+    nrow, ncol = image.shape
+    if nrow % 2 or ncol % 2:
+        image = np.pad(image, ((0, nrow % 2), (0, ncol % 2)), mode='edge')
+    return 0.25 * (image[0::2, 0::2] + image[1::2, 0::2]
+                   + image[0::2, 1::2] + image[1::2, 1::2])
+
+
+def downsample_nearest(mask, level):
+    """Returns the view of mask at level (every 2**level-th pixel)"""
+    factor = 2**level
+    return mask[::factor, ::factor]
+
+
+class ImagePyramid:
+
+
+    def __init__(self, image):
+        """Computes the display limits and all the levels (as 8-bit display
+        buffers) of the intensities of image"""
+        self.image = image
+        self.limits = display_limits(image)
+        self.levels = [to_display(image, self.limits)]
+        while min(self.levels[-1].shape) >= 2*MIN_SIZE:
+            level = downsample_mean(self.levels[-1])
+            self.levels.append(np.rint(level).astype(np.uint8))
+
+
+    def level(self, k):
+        return self.levels[min(k, len(self.levels)-1)]
+
+
+def choose_level(xlim, ylim, width, height, maxlevel):
+    """Returns the coarsest level (at most maxlevel) which has at least one
+    pixel per screen pixel, for a view of the limits xlim, ylim (in pixels
+    of the frame) shown on width x height screen pixels"""
+    if width <= 0 or height <= 0:
+        return 0
+    scale = min(abs(xlim[1] - xlim[0]) / width, abs(ylim[1] - ylim[0]) / height)
+    if scale < 2:
+        return 0
+    return int(min(np.floor(np.log2(scale)), maxlevel))
+
+
+def visible_window(xlim, ylim, shape, level):
+    """Returns the window (rmin, cmin, rmax, cmax) of the level of a frame
+    of the given shape which covers the view xlim, ylim, with a margin of
+    one pixel"""
+    factor = 2**level
+    nrow = -(-shape[0] // factor)
+    ncol = -(-shape[1] // factor)
+    x0, x1 = sorted(xlim)
+    y0, y1 = sorted(ylim)
+    c0 = min(max(int(np.floor((x0 + 0.5) / factor)) - 1, 0), ncol)
+    c1 = max(min(int(np.ceil((x1 + 0.5) / factor)) + 1, ncol), c0)
+    r0 = min(max(int(np.floor((y0 + 0.5) / factor)) - 1, 0), nrow)
+    r1 = max(min(int(np.ceil((y1 + 0.5) / factor)) + 1, nrow), r0)
+    return r0, c0, r1, c1
+
+
+def window_extent(window, shape, level):
+    """Returns the extent (left, right, bottom, top) in pixels of the frame
+    of the window of a level, for imshow with origin 'upper'"""
+    factor = 2**level
+    r0, c0, r1, c1 = window
+    return (c0*factor - 0.5, min(c1*factor, shape[1]) - 0.5,
+            min(r1*factor, shape[0]) - 0.5, r0*factor - 0.5)
+
+
+def level_bbox(bbox, window, level):
+    """Returns the bounding box (rmin, cmin, rmax, cmax) of the frame bbox
+    in the window of the nearest-neighbour level, or None if they do not
+    overlap"""
+    factor = 2**level
+    r0, c0, r1, c1 = (-(-v // factor) for v in bbox)
+    wr0, wc0, wr1, wc1 = window
+    r0, r1 = max(r0, wr0) - wr0, min(r1, wr1) - wr0
+    c0, c1 = max(c0, wc0) - wc0, min(c1, wc1) - wc0
+    if r1 <= r0 or c1 <= c0:
+        return None
+    return r0, c0, r1, c1
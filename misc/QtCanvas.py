@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+This file contains an alternative canvas of the GUI, which shows the frames
+and the masks directly with Qt (QGraphicsView and QImage) instead of
+matplotlib. The frames are converted to 8-bit buffers which are painted as
+they are, the masks are composited on top of them as RGBA images, and
+zooming and panning are done by the transformations of the views.
+
+The canvas keeps the interface of PlotCanvas (the editing tools of
+CanvasEditing, mouse events connected with mpl_connect, UpdatePlots, ...),
+such that the GUI works the same with both canvases. QtNavigation replaces
+the navigation toolbar of matplotlib.
+"""
+import numpy as np
+
+from PyQt5.QtWidgets import (QWidget, QLabel, QGraphicsView, QGraphicsScene,
+                             QGraphicsItem, QGraphicsSimpleTextItem,
+                             QRubberBand, QSizePolicy, QHBoxLayout,
+                             QVBoxLayout)
+from PyQt5.QtGui import QImage, QTransform
+from PyQt5.QtCore import Qt, QRect, QRectF, QSize
+
+from CanvasEditing import CanvasEditing
+from MaskOverlay import MaskOverlay
+from Pyramid import display_limits, to_display
+
+
+# mouse buttons, numbered as in matplotlib
+BUTTONS = {Qt.LeftButton: 1, Qt.MiddleButton: 2, Qt.RightButton: 3}
+
+
+def gray_buffer(picture):
+    """Returns the picture scaled between its display limits to uint8,
+    inverted like the gray_r colormap of the matplotlib canvas"""
+    buffer = to_display(picture, display_limits(picture))
+    np.subtract(255, buffer, out=buffer)
+    return buffer
+
+
+class MouseEvent:
+
+
+    def __init__(self, name, button, xdata, ydata, inaxes):
+        """Mouse event with the attributes of the matplotlib events used by
+        the tools: the button (1: left, 2: middle, 3: right), the pixel
+        coordinates xdata and ydata (None outside of the image) and the
+        panel inaxes"""
+        self.name = name
+        self.button = button
+        self.xdata = xdata
+        self.ydata = ydata
+        self.inaxes = inaxes
+
+
+class Title(QLabel):
+
+
+    def set_text(self, text):
+        self.setText(text)
+
+
+class ArrayItem(QGraphicsItem):
+
+
+    def __init__(self):
+        """Shows a numpy array, either an 8-bit grey image or an RGBA image,
+        through a QImage which shares its memory (no copy). Only the exposed
+        part of the image is painted. It has the methods of the matplotlib
+        images used by MaskOverlay."""
+        super().__init__()
+        self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+        self.set_data(np.zeros((1, 1), dtype=np.uint8))
+
+
+    def boundingRect(self):
+        return QRectF(0, 0, self.array.shape[1], self.array.shape[0])
+
+
+    def paint(self, painter, option, widget=None):
+        rect = option.exposedRect
+        painter.drawImage(rect, self.qimage, rect)
+
+
+    def set_data(self, array):
+        array = np.ascontiguousarray(array)
+        if array.ndim == 3:
+            fmt = QImage.Format_RGBA8888
+        else:
+            array = array.astype(np.uint8, copy=False)
+            fmt = QImage.Format_Grayscale8
+        if getattr(self, 'array', None) is None or array.shape[:2] != self.array.shape[:2]:
+            self.prepareGeometryChange()
+        self.array = array
+        self.qimage = QImage(array.data, array.shape[1], array.shape[0],
+                             array.strides[0], fmt)
+        self.update()
+
+
+    def get_array(self):
+        return self.array
+
+
+    def changed(self):
+        self.update()
+
+
+    def changed_bbox(self, bbox):
+        """Repaints only the bounding box (rmin, cmin, rmax, cmax)"""
+        r0, c0, r1, c1 = bbox
+        self.update(QRectF(c0, r0, c1 - c0, r1 - r0))
+
+
+    def set_visible(self, visible):
+        self.setVisible(visible)
+
+
+    def get_visible(self):
+        return self.isVisible()
+
+
+class PanelView(QGraphicsView):
+
+
+    def __init__(self, canvas):
+        """View of one panel (previous, current or next frame). It plays the
+        role of a matplotlib axis for the tools, and forwards the mouse
+        events to the canvas."""
+        super().__init__()
+        self.canvas = canvas
+        self.setScene(QGraphicsScene(self))
+        self.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setVerticalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        self.setTransformationAnchor(QGraphicsView.NoAnchor)
+        self.setViewportUpdateMode(QGraphicsView.SmartViewportUpdate)
+        self.setMinimumSize(QSize(50, 50))
+
+        self.image = ArrayItem()
+        self.mask = ArrayItem()
+        self.mask.setZValue(1)
+        self.scene().addItem(self.image)
+        self.scene().addItem(self.mask)
+
+        self.rubberband = QRubberBand(QRubberBand.Rectangle, self.viewport())
+        self.origin = None
+        self.horizontalScrollBar().valueChanged.connect(self.scrolled)
+        self.verticalScrollBar().valueChanged.connect(self.scrolled)
+
+
+    def set_image(self, buffer):
+        self.image.set_data(buffer)
+        self.scene().setSceneRect(self.image.boundingRect())
+
+
+    def visible_rect(self):
+        """Returns the part of the scene shown in the view"""
+        return self.mapToScene(self.viewport().rect()).boundingRect()
+
+
+    def scrolled(self):
+        self.canvas.sync_views(self)
+
+
+    def data_coords(self, qevent):
+        """Returns the pixel coordinates of the event, or None outside of
+        the image"""
+        pos = self.mapToScene(qevent.pos())
+        if self.image.boundingRect().contains(pos):
+            return pos.x(), pos.y()
+        return None, None
+
+
+    def mousePressEvent(self, qevent):
+        mode = self.canvas.navigation.mode
+        if mode == 'zoom' and qevent.button() == Qt.LeftButton:
+            self.origin = qevent.pos()
+            self.rubberband.setGeometry(QRect(self.origin, QSize()))
+            self.rubberband.show()
+        elif mode is None:
+            self.canvas.dispatch('button_press_event', self, qevent)
+        super().mousePressEvent(qevent)
+
+
+    def mouseMoveEvent(self, qevent):
+        if self.origin is not None:
+            self.rubberband.setGeometry(QRect(self.origin, qevent.pos()).normalized())
+        elif self.canvas.navigation.mode is None:
+            self.canvas.dispatch('motion_notify_event', self, qevent)
+        super().mouseMoveEvent(qevent)
+
+
+    def mouseReleaseEvent(self, qevent):
+        mode = self.canvas.navigation.mode
+        if self.origin is not None:
+            self.rubberband.hide()
+            rect = QRect(self.origin, qevent.pos()).normalized()
+            self.origin = None
+            if rect.width() > 5 and rect.height() > 5:
+                self.canvas.navigation.push(self.mapToScene(rect).boundingRect())
+        elif mode == 'pan':
+            self.canvas.navigation.push(self.visible_rect())
+        elif mode is None:
+            self.canvas.dispatch('button_release_event', self, qevent)
+        super().mouseReleaseEvent(qevent)
+
+
+    def resizeEvent(self, qevent):
+        super().resizeEvent(qevent)
+        self.canvas.set_view(self.canvas.view)
+
+
+class QtCanvas(CanvasEditing, QWidget):
+
+
+    def __init__(self, parent=None):
+        """this class defines the canvas with three panels showing the
+        previous, current and next time index, like PlotCanvas.
+        """
+        QWidget.__init__(self, parent)
+        self.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Expanding)
+
+        # part of the scene shown in the panels
+        self.view = None
+        self.syncing = False
+
+        self.ax2 = PanelView(self)
+        self.ax = PanelView(self)
+        self.ax3 = PanelView(self)
+        self.panels = [self.ax2, self.ax, self.ax3]
+
+        self.titleprev = Title('No frame {}'.format(''))
+        self.titlecurr = Title('Time index {}'.format(parent.Tindex))
+        self.titlenext = Title('Next time index {}'.format(parent.Tindex+1))
+
+        layout = QHBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        for title, panel in zip((self.titleprev, self.titlecurr, self.titlenext),
+                                self.panels):
+            title.setAlignment(Qt.AlignCenter)
+            column = QVBoxLayout()
+            column.addWidget(title)
+            column.addWidget(panel)
+            layout.addLayout(column)
+
+        # the self.currpicture attribute takes the original data and will then
+        # contain the updates drawn by the user.
+        self.currpicture = parent.currentframe
+        self.prevpicture = parent.blankframe
+        self.nextpicture = parent.nextframe
+        self.plotmask = parent.mask_curr
+        self.prevplotmask = np.zeros([parent.reader.sizey, parent.reader.sizex], dtype =np.uint16)
+        self.nextplotmask = parent.mask_next
+        self.tempmask = self.plotmask.copy()
+        self.tempplotmask = self.plotmask.copy()
+
+        # the masks are colored through a lookup table directly into the
+        # RGBA arrays shown on top of the frames
+        colormap = self.DefineColormap(21)
+        self.curroverlay = MaskOverlay(self.ax.mask, colormap)
+        self.prevoverlay = MaskOverlay(self.ax2.mask, colormap)
+        self.nextoverlay = MaskOverlay(self.ax3.mask, colormap)
+
+        # 8-bit display buffers of the frames shown, by frame
+        self.buffers = {}
+
+        # lists of the text items showing the values of the cells
+        self.ann_list = []
+        self.ann_list_prev = []
+        self.ann_list_next = []
+
+        # mouse events connected with mpl_connect, by id
+        self.callbacks = {}
+        self.cid = 0
+        self.button = None
+
+        self.navigation = QtNavigation(self)
+
+        self.InitEditing(parent)
+        self.UpdatePlots()
+        self.navigation.home()
+
+
+    def mpl_connect(self, name, func):
+        """Connects func to the mouse events name ('button_press_event',
+        'button_release_event' or 'motion_notify_event'), like the method
+        of the matplotlib canvas. Returns the id of the connection."""
+        self.cid += 1
+        self.callbacks[self.cid] = (name, func)
+        return self.cid
+
+
+    def mpl_disconnect(self, cid):
+        self.callbacks.pop(cid, None)
+
+
+    def dispatch(self, name, panel, qevent):
+        """Calls the functions connected to the event name. As in matplotlib,
+        the motion events carry the button pressed last."""
+        if name == 'button_press_event':
+            self.button = BUTTONS.get(qevent.button())
+            button = self.button
+        elif name == 'button_release_event':
+            button = BUTTONS.get(qevent.button())
+            self.button = None
+        else:
+            button = self.button
+        xdata, ydata = panel.data_coords(qevent)
+        event = MouseEvent(name, button, xdata, ydata, panel)
+        for cid, (cname, func) in list(self.callbacks.items()):
+            if cname == name and cid in self.callbacks:
+                func(event)
+
+
+    def set_view(self, rect):
+        """Shows the part rect of the scene in all panels"""
+        if rect is None or rect.isEmpty():
+            return
+        self.view = rect
+        self.syncing = True
+        for panel in self.panels:
+            panel.fitInView(rect, Qt.KeepAspectRatio)
+        self.syncing = False
+
+
+    def sync_views(self, source):
+        """Follows the panning of the panel source in the other panels"""
+        if self.syncing:
+            return
+        self.syncing = True
+        self.view = source.visible_rect()
+        for panel in self.panels:
+            if panel is not source:
+                panel.setTransform(source.transform())
+                panel.centerOn(self.view.center())
+        self.syncing = False
+
+
+    def draw(self):
+        for panel in self.panels:
+            panel.viewport().update()
+
+
+    def UpdatePlots(self):
+        """
+        Updates plots, handles mask and cell numbers.
+        """
+        # the display buffers are computed only once for the frames shown
+        buffers = {}
+        for panel, picture in ((self.ax, self.currpicture),
+                               (self.ax2, self.prevpicture),
+                               (self.ax3, self.nextpicture)):
+            entry = self.buffers.get(id(picture))
+            if entry is None or entry[0] is not picture:
+                entry = (picture, gray_buffer(picture))
+            buffers[id(picture)] = entry
+            panel.set_image(entry[1])
+        self.buffers = buffers
+
+        # Plot masks, hidden masks are just not drawn
+        visible = not self.button_hidemask_check.isChecked()
+        for panel in self.panels:
+            panel.mask.set_visible(visible)
+        if visible:
+            self.curroverlay.set_mask(self.plotmask)
+            self.prevoverlay.set_mask(self.prevplotmask)
+            self.nextoverlay.set_mask(self.nextplotmask)
+
+        # the masks of the panels may have been replaced
+        self.MaskChanged()
+        self.ShowCellNumbers()
+
+
+    def updatedata(self, flag=True, bbox=None):
+        """Shows the mask of the current panel (self.plotmask if flag, else
+        self.tempmask). If bbox (rmin, cmin, rmax, cmax) is given, only this
+        edited part of the overlay is updated and repainted."""
+        mask = self.plotmask if flag else self.tempmask
+        if bbox is None:
+            self.curroverlay.set_mask(mask)
+        else:
+            self.curroverlay.update(mask, bbox)
+        self.MaskChanged(self.plotmask)
+        if self.button_showval_check.isChecked():
+            self.ShowCellNumbersCurr()
+
+
+    def HideMask(self):
+        self.UpdatePlots()
+
+
+    def ShowCellNumbers(self):
+        """Checks whether to show cell numbers, and does so if button is
+        checked"""
+        self.MaskChanged(self.plotmask)
+        if self.button_showval_check.isChecked():
+            self.ShowCellNumbersCurr()
+            self.ShowCellNumbersNext()
+            self.ShowCellNumbersPrev()
+        else:
+            self.clearAnnLists()
+
+
+    def _placeNumbers(self, panel, ann_list, plotmask):
+        """Shows the values of the cells of plotmask, centered on the cells.
+        The text items of ann_list are a pool which is reused: they are only
+        moved and retexted, and the extra ones are hidden. The text keeps
+        its size when zooming."""
+        vals, xtemp, ytemp = self._getCellCenters(plotmask)
+        for i in range(len(ann_list), len(vals)):
+            ann = QGraphicsSimpleTextItem()
+            ann.setFlag(QGraphicsItem.ItemIgnoresTransformations)
+            ann.setZValue(2)
+            panel.scene().addItem(ann)
+            ann_list.append(ann)
+        for ann, val, x, y in zip(ann_list, vals, xtemp, ytemp):
+            text = str(val)
+            if ann.text() != text:
+                ann.setText(text)
+                rect = ann.boundingRect()
+                ann.setTransform(QTransform.fromTranslate(-rect.width()/2, -rect.height()/2))
+            ann.setPos(x, y)
+            ann.setVisible(True)
+        for ann in ann_list[len(vals):]:
+            ann.setVisible(False)
+
+
+    def ShowCellNumbersCurr(self):
+        self._placeNumbers(self.ax, self.ann_list, self.plotmask)
+
+
+    def ShowCellNumbersPrev(self):
+        self._placeNumbers(self.ax2, self.ann_list_prev, self.prevplotmask)
+
+
+    def ShowCellNumbersNext(self):
+        self._placeNumbers(self.ax3, self.ann_list_next, self.nextplotmask)
+
+
+    def clearAnnLists(self):
+        """Hides all the cell values, the text items are kept for reuse"""
+        for ann in self.ann_list + self.ann_list_prev + self.ann_list_next:
+            ann.setVisible(False)
+
+
+class QtNavigation:
+
+
+    def __init__(self, canvas):
+        """Zoom, pan and history of the views of the QtCanvas, with the
+        methods of the matplotlib navigation toolbar used by the GUI"""
+        self.canvas = canvas
+        self.mode = None
+        self.history = []
+        self.position = -1
+
+
+    def _set_mode(self, mode):
+        self.mode = None if self.mode == mode else mode
+        drag = QGraphicsView.ScrollHandDrag if self.mode == 'pan' else QGraphicsView.NoDrag
+        for panel in self.canvas.panels:
+            panel.setDragMode(drag)
+
+
+    def zoom(self):
+        """Toggles the zoom mode: a rectangle drawn with the left button is
+        zoomed on"""
+        self._set_mode('zoom')
+
+
+    def pan(self):
+        """Toggles the pan mode: the view is dragged with the left button"""
+        self._set_mode('pan')
+
+
+    def push(self, rect):
+        """Shows rect and adds it to the history of views, after the current
+        position"""
+        del self.history[self.position+1:]
+        self.history.append(rect)
+        self.position = len(self.history) - 1
+        self.canvas.set_view(rect)
+
+
+    def home(self):
+        self.push(self.canvas.ax.image.boundingRect())
+
+
+    def back(self):
+        if self.position > 0:
+            self.position -= 1
+            self.canvas.set_view(self.history[self.position])
+
+
+    def forward(self):
+        if self.position < len(self.history) - 1:
+            self.position += 1
+            self.canvas.set_view(self.history[self.position])
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+History of the edits of the masks, for undo and redo. Every edit is stored
+as the bounding box of the changed pixels with their old and new values
+(see Reader.SaveMask), such that a step costs the size of the edited region
+instead of the whole frame. There is one history per (FOV, time index), and
+the oldest edits are forgotten once the memory budget is exceeded.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+
+# memory budget of the history of all frames, in bytes
+UNDO_BUDGET = 256 * 2**20
+
+
+# values old and new of the bounding box bbox (rmin, cmin, rmax, cmax) of a
+# mask, seq orders the edits of all frames
+Edit = namedtuple('Edit', ['bbox', 'old', 'new', 'seq'])
+
+
+class UndoHistory:
+
+
+    def __init__(self, budget=UNDO_BUDGET):
+        self.budget = budget
+        self.undos = {}
+        self.redos = {}
+        self.nbytes = 0
+        self.seq = 0
+
+
+    def record(self, key, bbox, old, new):
+        """Adds the edit of the frame key (FOV, time index), where the
+        bounding box bbox of the mask has changed from old to new. The edits
+        which were undone on this frame cannot be redone anymore."""
+        edit = Edit(tuple(int(v) for v in bbox), np.array(old), np.array(new), self.seq)
+        self.seq += 1
+        self._forget(self.redos.pop(key, []))
+        self.undos.setdefault(key, []).append(edit)
+        self.nbytes += edit.old.nbytes + edit.new.nbytes
+        self._trim()
+
+
+    def can_undo(self, key):
+        return bool(self.undos.get(key))
+
+
+    def can_redo(self, key):
+        return bool(self.redos.get(key))
+
+
+    def undo(self, key, mask):
+        """Reverts the last edit of the frame key in mask (in place).
+        Returns the bounding box of the reverted pixels, or None if there is
+        nothing to undo."""
+        return self._move(key, mask, self.undos, self.redos, 'new', 'old')
+
+
+    def redo(self, key, mask):
+        """Applies again the last undone edit of the frame key to mask (in
+        place). Returns the bounding box of the changed pixels, or None if
+        there is nothing to redo."""
+        return self._move(key, mask, self.redos, self.undos, 'old', 'new')
+
+
+    def clear(self, key=None):
+        """Forgets the history of the frame key (default: of all frames)"""
+        keys = list(set(self.undos) | set(self.redos)) if key is None else [key]
+        for k in keys:
+            self._forget(self.undos.pop(k, []))
+            self._forget(self.redos.pop(k, []))
+
+
+    def _move(self, key, mask, source, target, current, restored):
+        stack = source.get(key)
+        if not stack:
+            return None
+        edit = stack[-1]
+        r0, c0, r1, c1 = edit.bbox
+        window = mask[r0:r1, c0:c1]
+        if not np.array_equal(window, getattr(edit, current)):
+            # the mask was changed without being recorded (e.g. by the
+            # neural network or the tracking), the history is not valid
+            self.clear(key)
+            raise ValueError('The mask has been changed since this edit, '
+                             'its history has been cleared.')
+        window[...] = getattr(edit, restored)
+        target.setdefault(key, []).append(stack.pop())
+        return edit.bbox
+
+
+    def _forget(self, edits):
+        for edit in edits:
+            self.nbytes -= edit.old.nbytes + edit.new.nbytes
+
+
+    def _trim(self):
+        """Forgets the oldest edits until the history fits the budget. The
+        edits to undo are forgotten from the oldest one, the edits to redo
+        from the one which would be redone last."""
+        while self.nbytes > self.budget:
+            stacks = [s for s in self.undos.values() if s]
+            if not stacks:
+                stacks = [s for s in self.redos.values() if s]
+            if not stacks:
+                break
+            stack = min(stacks, key=lambda s: s[0].seq)
+            self._forget([stack.pop(0)])
@@ -1,67 +1,190 @@
+import os
+import sys
+from glob import glob
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, Future
+
+import numpy as np
+import pandas as pd
+import tifffile
+from skimage.io import imread
+from skimage.filters import threshold_isodata
+from skimage.feature import peak_local_max
+from skimage.measure import label
+from skimage.transform import downscale_local_mean
+from skimage.segmentation import watershed
+from scipy.ndimage.morphology import distance_transform_edt
+
+# add local directories to sys.path
+sys.path.append('unet')
+import unet.neural_network as nn
+from unet.segment import cell_merge, correct_artefacts
+from unet.cell_statistics import CellStatistics
+from disk.run_manifest import RunManifest
+
+
+# name of the manifest of the completed files, in the output directory
+MANIFEST_NAME = 'manifest.jsonl'
+
+
+def segment_trans(im_trans, bin_trans=True, min_dist_pixels=10):
+    """Segments the trans image im_trans, returns the mask at the
+    resolution of im_trans"""
+    shape = im_trans.shape
+    if bin_trans:
+        im_trans = downscale_local_mean(im_trans, (2,2))
+    im_prediction = nn.prediction(im_trans, True)
+    threshold_value = threshold_isodata(im_prediction)
+    im_binary = im_prediction
+    im_binary[im_binary > threshold_value] = 255
+    im_binary[im_binary <= threshold_value] = 0
+    im_distance_transform = distance_transform_edt(im_binary)
+    im_peaks = peak_local_max(im_distance_transform, min_distance=min_dist_pixels, indices=False)
+    im_label = label(im_peaks)
+    im_watershed = watershed(-im_distance_transform, markers=im_label, mask=im_binary, connectivity=2)
+    im_merged = cell_merge(im_watershed, im_prediction)
+    im_correct = correct_artefacts(im_merged)
+    if bin_trans:
+        # back to the resolution of the fluorescence images
+        im_correct = im_correct.repeat(2, axis=0).repeat(2, axis=1)[:shape[0], :shape[1]]
+    return im_correct
+
+
+def process_file(file, fluor_channel_list, output_dir, bin_trans=True, min_dist_pixels=10):
+    """Segments the trans image file and measures the cells in the
+    fluorescence channels (files named like file with 'Trans' replaced by
+    the channel). The mask and the table of measurements are written to
+    output_dir, such that nothing but their paths is kept in memory."""
+    mask = segment_trans(imread(file), bin_trans, min_dist_pixels)
+
+    stats = CellStatistics(mask)
+    table = pd.DataFrame({'Cell': stats.cells, **stats.geometry()})
+    for channel_string in fluor_channel_list:
+        channel_im = imread(file.replace('Trans', channel_string))
+        for key, values in stats.intensity(channel_im).items():
+            table['{} {}'.format(channel_string, key)] = values
+
+    name = os.path.splitext(os.path.basename(file))[0]
+    mask_file = os.path.join(output_dir, name + '_mask.tif')
+    table_file = os.path.join(output_dir, name + '_cells.csv')
+    tifffile.imwrite(mask_file, mask.astype(np.uint16))
+    table.to_csv(table_file, index=False)
+    return PopulationResult(file, mask_file, table_file, len(stats.cells))
+
+
+class PopulationResult:
+
+
+    def __init__(self, file, mask_file, table_file, ncells):
+        """Result of one trans image file: the paths of its mask and of its
+        table of measurements, which are only read when asked for"""
+        self.file = file
+        self.mask_file = mask_file
+        self.table_file = table_file
+        self.ncells = ncells
+
+
+    def mask(self):
+        return tifffile.imread(self.mask_file)
+
+
+    def table(self):
+        return pd.read_csv(self.table_file)
+
+
 class PopulationBatch:
-    def __init__(self, directory, glob_pattern, fluor_channel_list, bin_trans=True, min_dist_pixels=10):
-        from glob import glob
-        import os
-        from skimage.io import imread
-        from skimage.filters import threshold_isodata
-        from skimage.feature import peak_local_max
-        from skimage.measure import label
-        from skimage.transform import downscale_local_mean
-        from skimage.segmentation import watershed
-        from scipy.ndimage.morphology import distance_transform_edt
-        import sys
-        # add local directories to sys.path
-        sys.path.append('unet')
-        import unet.neural_network as nn
-        from unet.segment import cell_merge, correct_artefacts
 
+
+    def __init__(self, directory, glob_pattern, fluor_channel_list, bin_trans=True,
+                 min_dist_pixels=10, output_dir=None, max_workers=None, resume=False):
+        """Batch of all trans image files of directory matching glob_pattern.
+        The files are processed when the batch is iterated over: they are
+        distributed over max_workers processes (each of which loads the
+        neural network), and the masks and measurements are written to
+        output_dir (default: the folder 'population_results' of directory)
+        as each file finishes. Iterating yields one PopulationResult per
+        file, in the order of the files.
+        
+        The completed files are recorded in a manifest in output_dir. If 
+        resume is True, the files completed by an earlier run with the same 
+        parameters (and whose outputs still exist) are not processed again."""
         # assign attributes
         self.directory = directory
         self.glob_pattern = glob_pattern
         self.fluor_channel_list = fluor_channel_list
-        self.bin_trans = True
+        self.bin_trans = bin_trans
         self.min_dist_pixels = min_dist_pixels
+        self.output_dir = output_dir or os.path.join(directory, 'population_results')
+        self.max_workers = max_workers
+        self.resume = resume
 
-        # generate masks
-        glob_files = glob(os.path.join(directory, glob_pattern))
-        self.glob_files = glob_files
         # the glob pattern should contain all trans image files to process
-        mask_im_list = []
-        fluor_list_list = [] #this will be a list of lists
-        trans_im_list = []
-        for i, file in enumerate(glob_files):
-            print('Processing image ' + str(i+1) + ' of ' +str(len(glob_files)))
-            im_trans = imread(file)
-            trans_im_list.append(im_trans)
-            if bin_trans:
-                im_trans = downscale_local_mean(im_trans, (2,2))
-            im_prediction = nn.prediction(im_trans, True)
-            threshold_value = threshold_isodata(im_prediction)
-            im_binary = im_prediction
-            im_binary[im_binary > threshold_value] = 255
-            im_binary[im_binary <= threshold_value] = 0
-            im_distance_transform = distance_transform_edt(im_binary)
-            im_peaks = peak_local_max(im_distance_transform, min_distance=min_dist_pixels, indices=False)
-            im_label = label(im_peaks)
-            im_watershed = watershed(-im_distance_transform, markers=im_label, mask=im_binary, connectivity=2)
-            im_merged = cell_merge(im_watershed, im_prediction)
-            im_correct = correct_artefacts(im_merged)
-            mask_im_list.append(im_correct)
-            # read in the fluor channels
-            channel_im_list = []
-            for channel_string in fluor_channel_list:
-                channel_im = imread(file.replace('Trans', channel_string))
-                channel_im_list.append(channel_im)
+        self.glob_files = sorted(glob(os.path.join(directory, glob_pattern)))
+
 
-            fluor_list_list.append(channel_im_list)
-        self.mask_im_list = mask_im_list
-        self.fluor_list_list = fluor_list_list
-        self.trans_im_list = trans_im_list
+    def __len__(self):
+        return len(self.glob_files)
 
 
+    def parameters(self):
+        """Returns the parameters which determine the results of a file"""
+        return {'fluor_channel_list': list(self.fluor_channel_list),
+                'bin_trans': self.bin_trans,
+                'min_dist_pixels': self.min_dist_pixels}
 
 
+    def completed(self, manifest, file):
+        """Returns the result of file recorded in manifest if its outputs
+        still exist, else None"""
+        record = manifest.get(file)
+        if record is None or not (os.path.isfile(record['mask_file']) 
+                                  and os.path.isfile(record['table_file'])):
+            return None
+        return PopulationResult(file, record['mask_file'], record['table_file'], 
+                                record['ncells'])
 
 
+    def __iter__(self):
+        """Processes the files and yields their results. Only a few files
+        more than the number of processes are submitted at once, such that
+        the memory stays bounded for any number of files. Every file is 
+        recorded in the manifest as soon as it is finished."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        manifest = RunManifest(os.path.join(self.output_dir, MANIFEST_NAME), 
+                               self.parameters())
+        
+        def record(future):
+            if not future.cancelled() and future.exception() is None:
+                result = future.result()
+                manifest.record(result.file, mask_file=result.mask_file, 
+                                table_file=result.table_file, ncells=result.ncells)
+        
+        window = 2 * (self.max_workers or os.cpu_count() or 1)
+        with ProcessPoolExecutor(self.max_workers) as executor:
+            pending = deque()
+            for file in self.glob_files:
+                result = self.completed(manifest, file) if self.resume else None
+                if result is not None:
+                    future = Future()
+                    future.set_result(result)
+                else:
+                    future = executor.submit(process_file, file, self.fluor_channel_list,
+                                             self.output_dir, self.bin_trans,
+                                             self.min_dist_pixels)
+                    future.add_done_callback(record)
+                pending.append(future)
+                if len(pending) >= window:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
 
 
+    def run(self):
+        """Processes all files, printing the progress. Returns the list of
+        results (paths, not images)."""
+        results = []
+        for i, result in enumerate(self):
+            print('Processed image ' + str(i+1) + ' of ' + str(len(self)) +
+                  ': ' + str(result.ncells) + ' cells')
+            results.append(result)
+        return results
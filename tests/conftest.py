@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the modules of the GUI import each other from these folders
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for folder in ('unet', 'disk', 'misc', 'init'):
+    sys.path.insert(0, os.path.join(ROOT, folder))
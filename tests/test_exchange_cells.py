@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+
+from relabel import relabel, exchange_mapping
+
+
+def test_exchange_mapping():
+    assert exchange_mapping(3, 5) == {3: 5, 5: 3}
+
+
+@pytest.mark.parametrize('value1, value2', [(0, 3), (3, 0), (3, 3)])
+def test_exchange_mapping_rejects(value1, value2):
+    with pytest.raises(ValueError):
+        exchange_mapping(value1, value2)
+
+
+def masks(nframes=4):
+    mask = np.zeros((20, 30), dtype=np.uint16)
+    mask[2:8, 3:9] = 3
+    mask[10:15, 12:20] = 5
+    return [mask.copy() for t in range(nframes)]
+
+
+def test_exchange_with_background_and_propagate(tmp_path):
+    """An exchange with the background, to be propagated to the later 
+    frames, is refused before any frame is changed (in the order of 
+    App.DialogBoxECV)"""
+    h5py = pytest.importorskip('h5py')
+    Reader = pytest.importorskip('Reader')
+    import cell_features as cf
+
+    path = str(tmp_path / 'masks.h5')
+    frames = masks()
+    with h5py.File(path, 'w') as file:
+        for t, mask in enumerate(frames):
+            file.create_dataset('/FOV0/T{}'.format(t), data=mask, 
+                                compression='gzip')
+            file.create_dataset('/features/FOV0/T{}'.format(t), 
+                                data=cf.compute_features(mask))
+    reader = Reader.Reader.__new__(Reader.Reader)
+    reader.hdfpath = path
+    reader.fovlabels = ['FOV0']
+    reader.tlabels = ['T{}'.format(t) for t in range(len(frames))]
+
+    current = frames[0].copy()
+    with pytest.raises(ValueError):
+        mapping = exchange_mapping(0, 3)
+        relabel(current, mapping, out=current)
+        reader.RelabelFrames(1, len(frames)-1, 0, mapping)
+    assert np.array_equal(current, frames[0])
+
+    # the reader refuses it as well
+    with pytest.raises(ValueError):
+        reader.RelabelFrames(1, len(frames)-1, 0, {0: 3, 3: 0})
+
+    with h5py.File(path, 'r') as file:
+        for t, mask in enumerate(frames):
+            assert np.array_equal(file['/FOV0/T{}'.format(t)][()], mask)
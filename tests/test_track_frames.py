@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+
+def make_reader(path, nframes):
+    Reader = pytest.importorskip('Reader')
+    reader = Reader.Reader.__new__(Reader.Reader)
+    reader.hdfpath = path
+    reader.fovlabels = ['FOV0', 'FOV1']
+    reader.tlabels = ['T{}'.format(t) for t in range(nframes)]
+    reader.sizet = nframes
+    return reader
+
+
+def test_track_frames_without_masks(tmp_path):
+    """A field of view without any mask is left alone"""
+    h5py = pytest.importorskip('h5py')
+    path = str(tmp_path / 'masks.h5')
+    with h5py.File(path, 'w') as file:
+        file.create_dataset('/FOV0/T0', data=np.zeros((10, 10), np.uint16))
+    reader = make_reader(path, 3)
+    reader.TrackFrames(0, 2, 1)
+    with h5py.File(path, 'r') as file:
+        assert 'FOV1' not in file
+
+
+def test_track_frames_first_frame_unaltered(tmp_path):
+    """The first frame, without precedent, is not written again, and the
+    cells of the next frame take the values of the cells they follow"""
+    h5py = pytest.importorskip('h5py')
+    first = np.zeros((30, 30), np.uint16)
+    first[2:8, 2:8] = 4
+    first[15:25, 15:25] = 7
+    second = np.zeros((30, 30), np.uint16)
+    second[3:9, 2:8] = 1
+    second[15:26, 14:25] = 2
+
+    path = str(tmp_path / 'masks.h5')
+    with h5py.File(path, 'w') as file:
+        file.create_dataset('/FOV0/T0', data=first)
+        file.create_dataset('/FOV0/T1', data=second)
+    reader = make_reader(path, 2)
+    reader.TrackFrames(0, 1, 0)
+
+    with h5py.File(path, 'r') as file:
+        assert 'features/FOV0/T0' not in file
+        assert np.array_equal(file['/FOV0/T0'][()], first)
+        tracked = file['/FOV0/T1'][()]
+        assert tracked[5, 5] == 4 and tracked[20, 20] == 7
+        assert list(file['features/FOV0/T1'][()]['label']) == [4, 7]
@@ -57,6 +57,15 @@ class CustomDialog(QDialog):
         flo.addWidget(self.buttonBF)
         flo.addWidget(self.buttonPC)
         
+        self.check_overlap = QCheckBox('Track cells by their overlap (IoU), '
+                                       'for crowded colonies')
+        self.check_overlap.setChecked(app.tracking_cost == 'overlap')
+        flo.addWidget(self.check_overlap)
+        
+        self.check_resume = QCheckBox('Skip the frames already segmented with '
+                                      'the same parameters (resume a run)')
+        flo.addWidget(self.check_resume)
+        
         QBtn = QDialogButtonBox.Ok | QDialogButtonBox.Cancel
         
         self.buttonBox = QDialogButtonBox(QBtn)
@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Table of the geometric features of all cells of a mask: area, bounding box
+and the raw moments of the pixel coordinates, from which the centroid and
+the covariance follow. The moments are integer sums, such that the table
+can be updated exactly for the few cells touched by an edit instead of
+being recomputed from all the pixels.
+"""
+import numpy as np
+from scipy import ndimage
+
+
+# One row per cell, sorted by label. The bounding box of a cell is
+# [rmin, rmax) x [cmin, cmax).
+FEATURE_DTYPE = np.dtype([('label', np.int64),
+                          ('area', np.int64),
+                          ('rmin', np.int32),
+                          ('cmin', np.int32),
+                          ('rmax', np.int32),
+                          ('cmax', np.int32),
+                          ('sum_r', np.int64),
+                          ('sum_c', np.int64),
+                          ('sum_rr', np.int64),
+                          ('sum_cc', np.int64),
+                          ('sum_rc', np.int64)])
+
+_SUMS = ['area', 'sum_r', 'sum_c', 'sum_rr', 'sum_cc', 'sum_rc']
+
+
+def label_index(mask):
+    """Returns the cell values vals (vals[0] is the background 0) and the
+    image of indices into vals, to sum over the pixels of every cell with
+    bincount. If the cell values are negative, or sparse and large, they 
+    are compressed to consecutive indices such that bins stay small."""
+    lab = np.asarray(mask).astype(np.int64)
+    nbins = int(lab.max()) + 1 if lab.size > 0 else 1
+    if lab.size > 0 and (int(lab.min()) < 0 or nbins > lab.size):
+        vals, index = np.unique(lab, return_inverse=True)
+        index = index.reshape(lab.shape)
+        if vals[0] != 0:
+            # the background is moved (or added) to index 0
+            zero = np.searchsorted(vals, 0)
+            has_zero = zero < len(vals) and vals[zero] == 0
+            lookup = np.arange(1, len(vals)+1)
+            if has_zero:
+                lookup[zero] = 0
+                lookup[zero+1:] -= 1
+                vals = np.delete(vals, zero)
+            index = lookup[index]
+            vals = np.concatenate(([0], vals))
+        return vals, index
+    return np.arange(nbins), lab
+
+
+def moments(index, nbins, offset=(0, 0), names=_SUMS):
+    """Sums the features names (among _SUMS) over the pixels of every 
+    index of the image index, whose first pixel is at position offset of 
+    the mask"""
+    nrow, ncol = index.shape
+    flat = index.ravel()
+    rows = np.repeat(np.arange(offset[0], offset[0]+nrow, dtype=np.int64), ncol)
+    cols = np.tile(np.arange(offset[1], offset[1]+ncol, dtype=np.int64), nrow)
+    weights = {'sum_r': lambda: rows, 'sum_c': lambda: cols,
+               'sum_rr': lambda: rows*rows, 'sum_cc': lambda: cols*cols,
+               'sum_rc': lambda: rows*cols}
+
+    # the weighted sums are exact as long as they stay below 2**53
+    sums = {}
+    for name in names:
+        if name == 'area':
+            sums[name] = np.bincount(flat, minlength=nbins)
+        else:
+            sums[name] = np.rint(np.bincount(flat, weights=weights[name](),
+                                             minlength=nbins)).astype(np.int64)
+    return sums
+
+
+def cell_moments(mask, names=_SUMS):
+    """Returns the values of the cells of mask (sorted, background 
+    excluded) and the dictionary of the sums names (see moments, 'area' 
+    has to be one of them) over the pixels of every cell, in a single pass
+    over the pixels"""
+    vals, index = label_index(mask)
+    sums = moments(index, len(vals), names=names)
+    is_cell = sums['area'] > 0
+    is_cell[0] = False
+    return vals[is_cell], {name: sums[name][is_cell] for name in sums}
+
+
+def compute_features(mask):
+    """Computes the table of features (see FEATURE_DTYPE) of all the cells
+    of mask in a single pass over the pixels, background excluded"""
+    vals, index = label_index(mask)
+    sums = moments(index, len(vals))
+    slices = ndimage.find_objects(index, max_label=len(vals)-1)
+
+    is_cell = sums['area'] > 0
+    is_cell[0] = False
+    table = np.zeros(np.count_nonzero(is_cell), FEATURE_DTYPE)
+    table['label'] = vals[is_cell]
+    for name in _SUMS:
+        table[name] = sums[name][is_cell]
+
+    bbox = [(s[0].start, s[1].start, s[0].stop, s[1].stop)
+            for i, s in enumerate(slices, 1) if is_cell[i]]
+    if bbox:
+        bbox = np.array(bbox)
+        for k, name in enumerate(['rmin', 'cmin', 'rmax', 'cmax']):
+            table[name] = bbox[:, k]
+    return table
+
+
+def changed_bbox(old, new):
+    """Returns the bounding box (rmin, cmin, rmax, cmax) of the pixels which
+    differ between the masks old and new, or None if they are equal"""
+    diff = np.asarray(old) != np.asarray(new)
+    rows = np.flatnonzero(diff.any(axis=1))
+    if len(rows) == 0:
+        return None
+    cols = np.flatnonzero(diff[rows[0]:rows[-1]+1].any(axis=0))
+    return rows[0], cols[0], rows[-1]+1, cols[-1]+1
+
+
+def update_features(table, old, new, bbox=None):
+    """Returns the table of features of the mask new, given the table of the
+    mask old it was edited from. Only the pixels in the bounding box of the
+    changes bbox (see changed_bbox, computed if None) are visited: their
+    contributions to the moments of the old cells are subtracted and the
+    ones of the new cells added. The bounding boxes are then recomputed for
+    the touched cells, within their old bounding box and bbox. 
+    
+    If bbox is given, old can also be only the values of the window bbox of
+    the old mask."""
+    if bbox is None:
+        bbox = changed_bbox(old, new)
+        if bbox is None:
+            return table.copy()
+
+    r0, c0, r1, c1 = bbox
+    old = np.asarray(old)
+    if old.shape != (r1-r0, c1-c0):
+        old = old[r0:r1, c0:c1]
+    old_w = old.astype(np.int64)
+    new_w = np.asarray(new)[r0:r1, c0:c1].astype(np.int64)
+    changed = old_w != new_w
+
+    # all cells of the table and of the edited window, sorted
+    touched = np.union1d(old_w[changed], new_w[changed])
+    touched = touched[touched != 0]
+    labels = np.union1d(table['label'], touched)
+    out = np.zeros(len(labels), FEATURE_DTYPE)
+    out['label'] = labels
+    ix = np.searchsorted(labels, table['label'])
+    for name in FEATURE_DTYPE.names[1:]:
+        out[name][ix] = table[name]
+
+    # moments of the changed pixels, removed from the old cells and added to
+    # the new ones (the background is index 0 and is dropped)
+    for window, sign in ((old_w, -1), (new_w, 1)):
+        index = np.where(changed & (window != 0),
+                         np.searchsorted(labels, window) + 1, 0)
+        sums = moments(index, len(labels)+1, offset=(r0, c0))
+        for name in _SUMS:
+            out[name] += sign*sums[name][1:]
+
+    # new bounding boxes of the touched cells which still exist
+    new = np.asarray(new)
+    for label in touched:
+        i = np.searchsorted(labels, label)
+        if out['area'][i] <= 0:
+            continue
+        if out['rmax'][i] > out['rmin'][i]:
+            rmin = min(out['rmin'][i], r0)
+            cmin = min(out['cmin'][i], c0)
+            rmax = max(out['rmax'][i], r1)
+            cmax = max(out['cmax'][i], c1)
+        else:
+            rmin, cmin, rmax, cmax = r0, c0, r1, c1
+        sl = ndimage.find_objects((new[rmin:rmax, cmin:cmax] == label)
+                                  .astype(np.uint8))[0]
+        out['rmin'][i] = rmin + sl[0].start
+        out['cmin'][i] = cmin + sl[1].start
+        out['rmax'][i] = rmin + sl[0].stop
+        out['cmax'][i] = cmin + sl[1].stop
+
+    return out[out['area'] > 0]
+
+
+def relabel_features(table, mapping):
+    """Returns the table of features of a mask relabelled with the
+    dictionary mapping (see relabel.relabel). Cells mapped to 0 are removed,
+    and cells mapped to the same value are merged."""
+    if len(table) == 0:
+        return table.copy()
+
+    labels = np.array([mapping.get(l, l) for l in table['label']],
+                      dtype=np.int64)
+    keep = labels != 0
+    table, labels = table[keep], labels[keep]
+
+    newlabels, inverse = np.unique(labels, return_inverse=True)
+    out = np.zeros(len(newlabels), FEATURE_DTYPE)
+    out['label'] = newlabels
+    for name in _SUMS:
+        np.add.at(out[name], inverse, table[name])
+    for name, func, init in (('rmin', np.minimum, np.iinfo(np.int32).max),
+                             ('cmin', np.minimum, np.iinfo(np.int32).max),
+                             ('rmax', np.maximum, 0), ('cmax', np.maximum, 0)):
+        out[name] = init
+        func.at(out[name], inverse, table[name])
+    return out
+
+
+def remove_features(table, cells):
+    """Returns the table without the rows of the cells in the list cells"""
+    return table[~np.isin(table['label'], list(cells))]
+
+
+def centroids(table):
+    """Returns the rows and columns of the centers of mass of the cells"""
+    return table['sum_r'] / table['area'], table['sum_c'] / table['area']
+
+
+def covariances(table):
+    """Returns the variances of the rows and the columns and their
+    covariance over the pixels of every cell, normalized like the sample
+    covariance"""
+    n = table['area']
+    com_r, com_c = centroids(table)
+    dof = np.maximum(n - 1, 1)
+    cov_rr = (table['sum_rr'] - n*com_r**2) / dof
+    cov_cc = (table['sum_cc'] - n*com_c**2) / dof
+    cov_rc = (table['sum_rc'] - n*com_r*com_c) / dof
+    return cov_rr, cov_cc, cov_rc
+
+
+def tracking_features(table):
+    """Returns the cell values and the features used for tracking, in the
+    format of hungarian.cell_features"""
+    com_r, com_c = centroids(table)
+    return table['label'], np.column_stack((com_r, com_c, table['area']))
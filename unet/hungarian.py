@@ -1,11 +1,12 @@
 import numpy as np
-import pandas as pd
 from munkres import Munkres
 from sklearn.preprocessing import scale
 from sklearn.metrics.pairwise import euclidean_distances
+from relabel import relabel
+import cell_features as cf
 
 
-def correspondence(prev, curr):
+def correspondence(prev, curr, cost='features'):
     """
     Corrects correspondence between previous and current mask, returns current
     mask with corrected cell values. New cells are given the unique identifier
@@ -16,35 +17,133 @@ def correspondence(prev, curr):
     calculated between the cells of the previous and current frame. This is 
     then used as a cost for the bipartite matching problem which is in turn
     solved by the Hungarian algorithm as implemented in the munkres package.
+    
+    If cost is 'overlap', the cost of matching two cells is instead one minus
+    their intersection over union (see cell_overlap), and cells which do not
+    overlap with any cell of the previous frame are new cells. 
+    """
+    return next(track_frames([curr], prev, cost))
+
+
+def track_frames(masks, prev=None, cost='features'):
+    """
+    Tracks a sequence of consecutive masks in one streaming pass, and yields
+    each mask of the iterable masks with corrected cell values (see 
+    correspondence). prev is the already tracked mask preceding the first 
+    mask; if it is None, the first mask is yielded unaltered. 
+    
+    The features of every frame are computed exactly once and carried 
+    forward to the matching with the next frame, so the cost is linear in
+    the number of frames. A mask given as None (e.g. a missing frame) yields
+    None, and the following mask is treated as having no precedent.
+    """
+    frames = (None if m is None else (m,) + cell_features(m) for m in masks)
+    if prev is not None:
+        prev = (prev,) + cell_features(prev)
+    for new, mapping in track_features(frames, prev, cost):
+        yield new
+
+
+def track_features(frames, prev=None, cost='features'):
     """
-    newcell = np.max(prev) + 1
+    Same as track_frames, but every element of the iterable frames (and 
+    prev) is the tuple (mask, cells, features) with the cell values and 
+    features of the mask as returned by cell_features, such that features 
+    which are already known (e.g. stored with the masks) are not computed 
+    again. Yields for every frame the tuple (new mask, mapping), where 
+    mapping is the dictionary from the old to the new cell values (empty if
+    the mask is unaltered), or (None, None) for a frame given as None.
+    """
+    if cost not in ('features', 'overlap'):
+        raise ValueError('Unknown tracking cost {}'.format(cost))
+    
+    state = prev
     
-    hu_dict = hungarian_align(prev, curr)
-    new = curr.copy()
-    for key, val in hu_dict.items():
-        # If new cell
-        if val == -1:
-            val = newcell
-            newcell += 1
+    for frame in frames:
+        if frame is None:
+            state = None
+            yield None, None
+            continue
+        
+        curr, cells, feat = frame
+        if state is None:
+            yield curr, {}
+            state = frame
+            continue
+        
+        prev_mask, prev_cells, prev_feat = state
+        newcell = prev_cells.max() + 1 if len(prev_cells) > 0 else 1
+        
+        if cost == 'overlap':
+            hu_dict = align_overlap(prev_mask, prev_cells, prev_feat, 
+                                    curr, cells, feat)
+        else:
+            hu_dict = align_features(prev_cells, prev_feat, cells, feat)
+        for key, val in hu_dict.items():
+            # If new cell
+            if val == -1:
+                hu_dict[key] = newcell
+                newcell += 1
         
-        new[curr==key] = val
+        new = relabel(curr, hu_dict)
+        yield new, hu_dict
         
-    return new
+        # the features do not change with relabelling, only the cell values,
+        # which are kept sorted 
+        new_cells = np.array([hu_dict[c] for c in cells], dtype=np.int64)
+        order = np.argsort(new_cells)
+        state = new, new_cells[order], feat[order]
 
 
-def hungarian_align(m1, m2):
+def hungarian_align(m1, m2, cost='features'):
     """
     Aligns the cells using the hungarian algorithm using the euclidean distance as 
-    cost. 
+    cost (or the overlap, if cost is 'overlap'). 
     Returns dictionary of cells in m2 to cells in m1. If a cell is new, the dictionary 
     value is -1.
     """
-    dist, ix1, ix2 = cell_distance(m1, m2)
+    cells1, feat1 = cell_features(m1)
+    cells2, feat2 = cell_features(m2)
+    if cost == 'overlap':
+        return align_overlap(m1, cells1, feat1, m2, cells2, feat2)
+    return align_features(cells1, feat1, cells2, feat2)
+
+
+def align_features(cells1, feat1, cells2, feat2):
+    """
+    Same as hungarian_align, but takes the cell values and features of both
+    frames as returned by cell_features.
+    """
+    return assign(feature_distance(feat1, feat2), cells1, cells2)
+
+
+def align_overlap(m1, cells1, feat1, m2, cells2, feat2):
+    """
+    Same as hungarian_align with the overlap cost, but takes the cell values
+    and features of both frames as returned by cell_features.
+    """
+    if len(cells1)==0 or len(cells2)==0:
+        return assign(None, cells1, cells2)
     
+    ix1, ix2, iou = cell_overlap(m1, cells1, feat1[:,2], m2, cells2, feat2[:,2])
+    dist = np.ones((len(cells1), len(cells2)))
+    dist[ix1, ix2] = 1 - iou
+    return assign(dist, cells1, cells2, max_cost=1)
+
+
+def assign(dist, cells1, cells2, max_cost=None):
+    """
+    Solves the assignment problem between the cells of first and second frame
+    with cost matrix dist, using the hungarian algorithm. Returns dictionary 
+    of cells2 to cells1. If a cell is new, or if it is assigned with a cost
+    of at least max_cost, the dictionary value is -1.
+    """
     # If dist couldn't be calculated, return dictionary from cells to themselves 
     if dist is None:
-        unique_m2 = np.unique(m2)
-        return dict(zip(unique_m2, unique_m2))
+        return dict(zip(cells2, cells2))
+    
+    ix1 = dict(enumerate(cells1))
+    ix2 = dict(enumerate(cells2))
     
     solver = Munkres()
     indexes = solver.compute(make_square(dist))
@@ -52,28 +151,27 @@ def hungarian_align(m1, m2):
     # Create dictionary of cell indicies
     d = dict([(ix2.get(i2, -1), ix1.get(i1, -1)) for i1, i2 in indexes])
     d.pop(-1, None)  
+    
+    if max_cost is not None:
+        for i1, i2 in indexes:
+            if i1 in ix1 and i2 in ix2 and dist[i1, i2] >= max_cost:
+                d[ix2[i2]] = -1
     return d
 
 
-def cell_to_features(im, c, nsamples=None, time=None):
-    """Embeds cell c in image im into feature space"""
-    coord = np.argwhere(im==c)
-    area = coord.shape[0]
-    
-    if nsamples is not None:
-        samples = np.random.choice(area, min(nsamples, area), replace=False)
-        sampled = coord[samples,:]
-    else:
-        sampled = coord
-    
-    com = sampled.mean(axis=0)
-    
-    return {'cell': c,
-            'time': time,
-            'sqrtarea': np.sqrt(area),
-            'area': area,
-            'com_x': com[0],
-            'com_y': com[1]}
+def cell_features(im):
+    """
+    Embeds all cells of image im into feature space in a single pass over the
+    pixels. Returns the array of cell values (background excluded) and an 
+    array with one row per cell, containing the center of mass (row and 
+    column) and the area of the cell.
+    """
+    cells, sums = cf.cell_moments(im, ('area', 'sum_r', 'sum_c'))
+    area = sums['area']
+    features = np.column_stack((sums['sum_r'] / area,
+                                sums['sum_c'] / area,
+                                area))
+    return cells, features
     
     
 def cell_distance(m1, m2, weight_com=3):
@@ -83,39 +181,67 @@ def cell_distance(m1, m2, weight_com=3):
     as features, with center of mass weighted with factor weight_com (to 
     make it more important).
     """
-    # Modify to compute use more computed features
-    #cols = ['com_x', 'com_y', 'roundness', 'sqrtarea']
-    cols = ['com_x', 'com_y', 'area']
-
-    def get_features(m, t):
-        cells = list(np.unique(m))
-        if 0 in cells:
-            cells.remove(0)
-        features = [cell_to_features(m, c, time=t) for c in cells]
-        return pd.DataFrame(features), dict(enumerate(cells))
-    
-    # Create df, rescale
-    feat1, ix_to_cell1 = get_features(m1, 1)
-    feat2, ix_to_cell2 = get_features(m2, 2)
+    cells1, feat1 = cell_features(m1)
+    cells2, feat2 = cell_features(m2)
     
+    dist = feature_distance(feat1, feat2, weight_com)
+    if dist is None:
+        return None, None, None
+    return dist, dict(enumerate(cells1)), dict(enumerate(cells2))
+
+
+def feature_distance(feat1, feat2, weight_com=3):
+    """
+    Gives distance matrix between the features of the cells in first and 
+    second frame, as returned by cell_features (see cell_distance). 
+    """
     # Check if one of matrices doesn't contain cells
     if len(feat1)==0 or len(feat2)==0:
-        return None, None, None
+        return None
     
-    df = pd.concat((feat1, feat2))
-    df[cols] = scale(df[cols])
+    # Rescale, give more importance to center of mass
+    feat = scale(np.concatenate((feat1, feat2)))
+    feat[:,:2] = feat[:,:2] * weight_com
     
-    # give more importance to center of mass
-    df[['com_x', 'com_y']] = df[['com_x', 'com_y']] * weight_com
-
     # pairwise euclidean dist
-    dist = euclidean_distances(
-        df.loc[df['time']==1][cols],
-        df.loc[df['time']==2][cols]
-    )
-    return dist, ix_to_cell1, ix_to_cell2
+    return euclidean_distances(feat[:len(feat1)], feat[len(feat1):])
     
     
+def cell_overlap(m1, cells1, area1, m2, cells2, area2):
+    """
+    Gives the intersection over union (IoU) of all pairs of overlapping cells
+    between first and second frame. cells1 and cells2 are the sorted cell 
+    values of the two masks and area1 and area2 the areas of these cells, 
+    as given by cell_features.
+    
+    The contingency table of the cell values is built with one bincount over 
+    the pixels that belong to a cell in both frames, so the cost scales with 
+    the number of pixels and not with the number of pairs of cells. The IoU 
+    is returned in sparse form, as the index of the cell in cells1, the 
+    index of the cell in cells2 and the IoU of every overlapping pair.
+    """
+    lab1 = np.asarray(m1).astype(np.int64).ravel()
+    lab2 = np.asarray(m2).astype(np.int64).ravel()
+    both = (lab1 != 0) & (lab2 != 0)
+    
+    pos1 = np.searchsorted(cells1, lab1[both])
+    pos2 = np.searchsorted(cells2, lab2[both])
+    pair = pos1 * len(cells2) + pos2
+    
+    # dense contingency table only if it is small
+    npairs = len(cells1) * len(cells2)
+    if npairs <= max(2**20, pair.size):
+        counts = np.bincount(pair, minlength=npairs)
+        pair = np.flatnonzero(counts)
+        inter = counts[pair]
+    else:
+        pair, inter = np.unique(pair, return_counts=True)
+    
+    ix1, ix2 = np.divmod(pair, len(cells2))
+    iou = inter / (area1[ix1] + area2[ix2] - inter)
+    return ix1, ix2, iou
+
+
 def zero_pad(m, shape):
     """Pads matrix with zeros to be of desired shape"""
     out = np.zeros(shape)
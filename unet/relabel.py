@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""
+Functions to change cell values of masks in a single pass over the pixels,
+using a lookup table instead of one full-frame comparison per cell.
+"""
+import numpy as np
+from scipy import ndimage
+
+
+# Largest lookup table that is built directly. Masks with larger cell values
+# are relabelled through their unique values instead.
+MAX_LOOKUP_SIZE = 2**24
+
+
+def relabel(mask, mapping, out=None):
+    """
+    Returns mask in which every cell value that is a key of the dictionary
+    mapping is replaced by the corresponding value. Cell values that are not
+    in mapping stay unchanged.
+
+    The lookup table is indexed by the cell values, so the mask is only
+    traversed once, independently of the number of cells. If out is given
+    (it can be mask itself), the result is written into it.
+    """
+    mask = np.asarray(mask)
+    if out is None:
+        out = np.empty_like(mask)
+    if mask.size == 0:
+        return out
+
+    labels = mask.astype(np.int64, copy=False)
+    maxval = int(labels.max())
+
+    # keys which cannot appear in the mask are not needed
+    keys = np.fromiter(mapping.keys(), dtype=np.int64, count=len(mapping))
+    vals = np.fromiter(mapping.values(), dtype=np.int64, count=len(mapping))
+    keep = (keys >= 0) & (keys <= maxval)
+    keys = keys[keep]
+    vals = vals[keep]
+
+    if int(labels.min()) >= 0 and maxval < max(MAX_LOOKUP_SIZE, mask.size):
+        lut = np.arange(maxval+1, dtype=np.int64)
+        lut[keys] = vals
+        np.take(lut.astype(out.dtype), labels, out=out)
+
+    else:
+        # sparse or very large cell values, relabel the unique values
+        uniq, inverse = np.unique(labels, return_inverse=True)
+        newvals = uniq.copy()
+        ix = np.searchsorted(uniq, keys)
+        found = ix < len(uniq)
+        found[found] = uniq[ix[found]] == keys[found]
+        newvals[ix[found]] = vals[found]
+        out[...] = newvals[inverse].reshape(mask.shape)
+
+    return out
+
+
+def exchange_mapping(value1, value2):
+    """Returns the mapping (see relabel) which swaps the cells value1 and
+    value2. Raises ValueError if one of them is the background (0), which 
+    would be swapped with the whole background, or if they are equal."""
+    if value1 == 0 or value2 == 0:
+        raise ValueError('The background cannot be exchanged with a cell.')
+    if value1 == value2:
+        raise ValueError('The two cell values are the same.')
+    return {value1: value2, value2: value1}
+
+
+def remove_cells(mask, cells, out=None):
+    """Returns mask in which all the cells in the list cells are set to
+    background (0)"""
+    return relabel(mask, dict.fromkeys(cells, 0), out)
+
+
+def merge_with_neighbors(mask, row, col):
+    """Sets all the cells connected (8-connectivity) to the cell at (row,
+    col) of mask to its value, in place. Returns the bounding box (rmin,
+    cmin, rmax, cmax) of the merged cells, or None on the background.
+
+    The connected component is labelled in a window around the clicked
+    pixel, which is doubled as long as the component touches its border,
+    such that only the pixels around the merged cells are visited."""
+    value = mask[row, col]
+    if value == 0:
+        return None
+
+    nrow, ncol = mask.shape
+    half = 16
+    while True:
+        r0, r1 = max(row - half, 0), min(row + half + 1, nrow)
+        c0, c1 = max(col - half, 0), min(col + half + 1, ncol)
+        window = mask[r0:r1, c0:c1]
+        labels, _ = ndimage.label(window > 0, structure=np.ones((3, 3)))
+        component = labels == labels[row - r0, col - c0]
+
+        # the component may continue outside of the window, unless the
+        # window reaches the border of the mask on that side
+        if not ((r0 > 0 and component[0].any()) 
+                or (r1 < nrow and component[-1].any())
+                or (c0 > 0 and component[:, 0].any()) 
+                or (c1 < ncol and component[:, -1].any())):
+            break
+        half *= 2
+
+    window[component] = value
+    rows = np.flatnonzero(component.any(axis=1))
+    cols = np.flatnonzero(component.any(axis=0))
+    return (int(r0 + rows[0]), int(c0 + cols[0]), 
+            int(r0 + rows[-1] + 1), int(c0 + cols[-1] + 1))